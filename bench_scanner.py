@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки конвейера GTIN Scanner Live
+
+Примеры:
+    python bench_scanner.py png labels.pdf --pages 200 --roi 0.05,0.45,0.35,0.9
+    python bench_scanner.py profile labels.pdf --pages 200 --roi 0.05,0.45,0.35,0.9
+    python bench_scanner.py preprocess labels.pdf --pages 200 --roi 0.05,0.45,0.35,0.9
+    python bench_scanner.py backends labels.pdf --pages 200 --roi 0.05,0.45,0.35,0.9
+"""
+
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+
+try:
+    import fitz  # PyMuPDF
+    from PIL import Image
+    import gtin_decoders
+    import gtin_preprocess
+    from gtin_scanner_live import GTINScanner
+except ImportError as e:
+    print(f"Ошибка импорта: {e}")
+    print("\nУстановите необходимые библиотеки:")
+    print("pip install -r requirements.txt")
+    sys.exit(1)
+
+
+def _parse_roi(value):
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("ожидается x0,y0,x1,y1 в долях страницы")
+    return tuple(parts)
+
+
+def _open_scanner(args) -> GTINScanner:
+    scanner = GTINScanner()
+    scanner.pdf_path = args.pdf
+    scanner.pdf_document = fitz.open(args.pdf)
+    scanner.roi_fractions = args.roi
+    return scanner
+
+
+def _page_range(scanner: GTINScanner, args):
+    total = len(scanner.pdf_document)
+    if args.pages and args.pages > 0:
+        total = min(total, args.pages)
+    return range(total)
+
+
+def _time_pages(scanner: GTINScanner, pages, fn) -> float:
+    """Прогоняет fn по страницам и возвращает среднее время на страницу (мс)."""
+    fn(scanner.pdf_document[pages[0]])  # прогрев
+    start = time.perf_counter()
+    for page_num in pages:
+        fn(scanner.pdf_document[page_num])
+    return (time.perf_counter() - start) * 1000.0 / len(pages)
+
+
+def _report(title: str, rows) -> None:
+    print("\n" + "=" * 70)
+    print(title)
+    print("=" * 70)
+    baseline = rows[0][1]
+    for name, ms in rows:
+        delta = baseline - ms
+        print(f"{name:<32} {ms:8.2f} мс/стр   экономия {delta:+7.2f} мс ({delta / baseline * 100:+.0f}%)")
+    print("=" * 70)
+
+
+def bench_png(args) -> None:
+    """PNG-кодирование пиксмапа против прямого копирования буфера пикселей."""
+    scanner = _open_scanner(args)
+    pages = _page_range(scanner, args)
+
+    def via_png(page):
+        clip = scanner._page_clip(page)
+        pix = page.get_pixmap(matrix=fitz.Matrix(scanner.SCAN_ZOOM, scanner.SCAN_ZOOM), clip=clip)
+        image = Image.open(io.BytesIO(pix.tobytes("png")))
+        image.convert("L").tobytes()
+
+    def via_samples(page):
+        clip = scanner._page_clip(page)
+        image = scanner._render_clip(page, clip, scanner.SCAN_ZOOM, "rgb")
+        image.convert("L").tobytes()
+        image.close()
+
+    _report(
+        f"Передача пикселей в декодер ({len(pages)} стр., {args.pdf})",
+        [
+            ("tobytes('png') + Image.open", _time_pages(scanner, pages, via_png)),
+            ("samples_mv -> Image.frombytes", _time_pages(scanner, pages, via_samples)),
+        ],
+    )
+
+
+def bench_profile(args) -> None:
+    """Сравнение профилей рендеринга: скорость и доля распознанных страниц."""
+    scanner = _open_scanner(args)
+    pages = _page_range(scanner, args)
+    rows = []
+    rates = {}
+    for name, settings in scanner.RENDER_PROFILES.items():
+        decoded_pages = set()
+
+        def run(page, name=name, settings=settings, decoded_pages=decoded_pages):
+            clip = scanner._page_clip(page)
+            image = scanner._render_clip(page, clip, scanner.SCAN_ZOOM, name)
+            # Как в _scan_clip: без sharpen предобработка не выполняется вовсе
+            if settings["sharpen"]:
+                image = scanner._optimize_for_datamatrix(image)
+            if scanner._decode_image(image, page.number):
+                decoded_pages.add(page.number)
+            image.close()
+
+        rows.append((f"{name}: рендер + декодирование", _time_pages(scanner, pages, run)))
+        rates[name] = len(decoded_pages) / len(pages) * 100
+
+    _report(f"Профили рендеринга ({len(pages)} стр., {args.pdf})", rows)
+    for name, rate in rates.items():
+        print(f"{name:<32} распознано {rate:5.1f}% страниц")
+
+
+def _allocated_bytes(fn, image) -> int:
+    """Память под новые изображения PIL и пик памяти NumPy за один вызов fn."""
+    created = []
+    original_new = Image.Image._new
+
+    def counting_new(self, im):
+        result = original_new(self, im)
+        created.append(result.width * result.height * len(result.getbands()))
+        return result
+
+    Image.Image._new = counting_new
+    tracemalloc.start()
+    try:
+        fn(image)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        Image.Image._new = original_new
+    return sum(created) + peak
+
+
+def bench_preprocess(args) -> None:
+    """PIL Contrast+Sharpness против слитой предобработки NumPy в общих буферах.
+
+    Время считается только для предобработки и подготовки пикселей для
+    декодера; рендеринг области в замер не входит.
+    """
+    scanner = _open_scanner(args)
+    pages = _page_range(scanner, args)
+    engine = gtin_preprocess.PreprocessEngine()
+
+    def via_pil(image):
+        scanner._optimize_for_datamatrix(image, sharpen=True).tobytes()
+
+    def via_numpy(image):
+        gtin_preprocess.DecoderPixels(engine.enhance(gtin_preprocess.as_gray_array(image), binarize=False))
+
+    def via_numpy_binarize(image):
+        gtin_preprocess.DecoderPixels(engine.enhance(gtin_preprocess.as_gray_array(image), binarize=True))
+
+    variants = [
+        ("PIL Contrast + Sharpness", via_pil),
+        ("NumPy: резкость + контраст", via_numpy),
+        ("NumPy: + бинаризация Оцу", via_numpy_binarize),
+    ]
+    elapsed = {name: 0.0 for name, _ in variants}
+    allocated = {name: 0 for name, _ in variants}
+    for page_num in pages:
+        page = scanner.pdf_document[page_num]
+        image = scanner._render_clip(page, scanner._page_clip(page), scanner.SCAN_ZOOM, "barcode")
+        for name, fn in variants:
+            start = time.perf_counter()
+            fn(image)
+            elapsed[name] += time.perf_counter() - start
+            allocated[name] += _allocated_bytes(fn, image)
+        image.close()
+
+    _report(
+        f"Предобработка ({len(pages)} стр., {args.pdf})",
+        [(name, elapsed[name] * 1000.0 / len(pages)) for name, _ in variants],
+    )
+    for name, _ in variants:
+        print(f"{name:<32} новая память {allocated[name] / len(pages) / 1024:9.1f} КБ/стр")
+    print(f"{'Буферов NumPy выделено всего':<32} {engine.allocations}")
+
+
+def bench_backends(args) -> None:
+    """Все установленные бэкенды декодирования на одних и тех же областях.
+
+    Области рендерятся и переводятся в оттенки серого один раз, в замер входит
+    только декодирование. Полнота — доля страниц, где бэкенд нашёл символ.
+    """
+    scanner = _open_scanner(args)
+    pages = _page_range(scanner, args)
+    crops = []
+    for page_num in pages:
+        page = scanner.pdf_document[page_num]
+        image = scanner._render_clip(page, scanner._page_clip(page), scanner.SCAN_ZOOM, "barcode")
+        crops.append(gtin_preprocess.as_gray_array(image))
+        image.close()
+
+    rows = []
+    recall = {}
+    for name in gtin_decoders.available_backends():
+        backend = gtin_decoders.create_backend(name)
+        backend.decode(crops[0])  # прогрев
+        decoded_pages = 0
+        start = time.perf_counter()
+        for gray in crops:
+            if backend.decode(gray):
+                decoded_pages += 1
+        elapsed = time.perf_counter() - start
+        rows.append((gtin_decoders.BACKENDS[name].title, elapsed * 1000.0 / len(crops)))
+        recall[name] = decoded_pages / len(crops) * 100
+
+    _report(f"Бэкенды декодирования ({len(crops)} стр., {args.pdf})", rows)
+    for (title, ms), name in zip(rows, recall):
+        print(f"{title:<32} {1000.0 / ms:8.1f} стр/с   распознано {recall[name]:5.1f}% страниц")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки GTIN Scanner Live")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("pdf", help="PDF файл для замеров")
+    common.add_argument("--pages", type=int, default=100, help="сколько страниц обработать (0 = все)")
+    common.add_argument(
+        "--roi",
+        type=_parse_roi,
+        default=(0.0, 0.0, 1.0, 1.0),
+        help="область в долях страницы: x0,y0,x1,y1 (по умолчанию вся страница)",
+    )
+
+    sub.add_parser("png", parents=[common], help="PNG round trip против samples").set_defaults(func=bench_png)
+    sub.add_parser("profile", parents=[common], help="профили рендеринга").set_defaults(func=bench_profile)
+    sub.add_parser("preprocess", parents=[common], help="PIL против NumPy-предобработки").set_defaults(
+        func=bench_preprocess
+    )
+    sub.add_parser("backends", parents=[common], help="сравнение бэкендов декодирования").set_defaults(
+        func=bench_backends
+    )
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
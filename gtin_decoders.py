@@ -0,0 +1,173 @@
+"""
+Бэкенды декодирования Data Matrix
+
+Сканер обращается к декодеру только через ``DecoderChain``: основной бэкенд
+и необязательный запасной, который пробуется, когда основной ничего не нашёл.
+Все бэкенды возвращают объекты в формате pylibdmtx (``Decoded(data, rect)``,
+``rect.top`` отсчитывается от нижнего края изображения), поэтому остальной
+конвейер не зависит от выбранного декодера.
+
+На вход бэкенд получает изображение PIL (L, RGB, RGBA) или двумерный массив
+``uint8`` в оттенках серого. Параметры, которые бэкенд не поддерживает,
+отбрасываются (см. ``options``).
+"""
+
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from pylibdmtx.pylibdmtx import Decoded, Rect, decode as libdmtx_decode
+
+import gtin_libdmtx
+import gtin_preprocess
+
+try:
+    import zxingcpp
+except ImportError:  # необязательный бэкенд
+    zxingcpp = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "libdmtx"
+
+
+class LibdmtxBackend:
+    """pylibdmtx — эталонный декодер, поддерживает все параметры libdmtx."""
+
+    name = "libdmtx"
+    title = "libdmtx (pylibdmtx)"
+    options = None  # все параметры передаются как есть
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def decode(self, image, **kwargs) -> list:
+        if isinstance(image, np.ndarray):
+            height, width = image.shape
+            pixels = gtin_preprocess.DecoderPixels(image)
+        else:
+            width, height = image.size
+            pixels = image.tobytes()
+        # pylibdmtx принимает (pixels, width, height) и сам определяет bpp
+        return libdmtx_decode((pixels, width, height), **kwargs)
+
+
+class LibdmtxNativeBackend:
+    """libdmtx через прямую привязку ``gtin_libdmtx`` с переиспользуемым состоянием.
+
+    Массив NumPy передаётся по адресу без копирования, изображение PIL
+    копируется через ``tobytes()``.
+    """
+
+    name = "libdmtx-native"
+    title = "libdmtx (прямая привязка)"
+    options = None
+
+    @staticmethod
+    def available() -> bool:
+        return gtin_libdmtx.available()
+
+    def __init__(self) -> None:
+        self._decoder = gtin_libdmtx.NativeDecoder()
+
+    def decode(self, image, **kwargs) -> list:
+        if isinstance(image, np.ndarray):
+            pixels = np.ascontiguousarray(image, dtype=np.uint8)
+            height, width = pixels.shape
+            bpp = 8
+        else:
+            pixels = np.frombuffer(image.tobytes(), dtype=np.uint8)
+            width, height = image.size
+            bpp = 8 * len(image.getbands())
+        return self._decoder.decode(pixels, width, height, bpp, **kwargs)
+
+
+class ZxingBackend:
+    """zxing-cpp: быстрее libdmtx на чистых символах, из параметров понимает только ``max_count``."""
+
+    name = "zxing"
+    title = "zxing-cpp"
+    options = frozenset({"max_count"})
+
+    @staticmethod
+    def available() -> bool:
+        return zxingcpp is not None
+
+    def decode(self, image, **kwargs) -> list:
+        if isinstance(image, np.ndarray):
+            gray = np.ascontiguousarray(image)
+        else:
+            gray = gtin_preprocess.as_gray_array(image)
+        height = gray.shape[0]
+        results = zxingcpp.read_barcodes(gray, formats=zxingcpp.BarcodeFormat.DataMatrix)
+        max_count = kwargs.get("max_count")
+        decoded = []
+        for result in results[:max_count] if max_count else results:
+            corners = (
+                result.position.top_left,
+                result.position.top_right,
+                result.position.bottom_right,
+                result.position.bottom_left,
+            )
+            xs = [point.x for point in corners]
+            ys = [point.y for point in corners]
+            x0, y1 = min(xs), max(ys)
+            rect = Rect(x0, height - y1, max(xs) - x0, y1 - min(ys))
+            decoded.append(Decoded(result.bytes, rect))
+        return decoded
+
+
+# OpenCV (4.x) не содержит декодера Data Matrix; новый бэкенд добавляется сюда
+BACKENDS = {
+    backend.name: backend for backend in (LibdmtxBackend, LibdmtxNativeBackend, ZxingBackend)
+}
+
+
+def available_backends() -> list[str]:
+    """Имена бэкендов, библиотеки которых установлены, в порядке регистрации."""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def create_backend(name: str):
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Неизвестный бэкенд декодирования: {name}")
+    if not backend.available():
+        raise ValueError(f"Бэкенд декодирования {name} не установлен")
+    return backend()
+
+
+class DecoderChain:
+    """Основной бэкенд и необязательный запасной для областей, где основной не нашёл символов.
+
+    ``hits`` считает, каким бэкендом распознано изображение; обновляется под
+    блокировкой, так как ячейки сетки декодируются из пула потоков.
+    """
+
+    def __init__(self, primary: str = DEFAULT_BACKEND, fallback: Optional[str] = None) -> None:
+        self.backends = [create_backend(primary)]
+        if fallback and fallback != primary:
+            self.backends.append(create_backend(fallback))
+        self.hits: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def names(self) -> list[str]:
+        return [backend.name for backend in self.backends]
+
+    def decode(self, image, **kwargs) -> list:
+        for backend in self.backends:
+            options = (
+                kwargs
+                if backend.options is None
+                else {key: value for key, value in kwargs.items() if key in backend.options}
+            )
+            decoded_objects = backend.decode(image, **options)
+            if decoded_objects:
+                with self._lock:
+                    self.hits[backend.name] += 1
+                return decoded_objects
+        return []
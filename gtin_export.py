@@ -0,0 +1,504 @@
+"""
+Потоковая запись результатов сканирования
+
+Коды пишутся в файл по мере обработки страниц, а не собираются в памяти до
+конца сканирования: после каждой страницы файл сбрасывается на диск, поэтому
+при остановке или сбое сохраняется всё обработанное, а промежуточный файл
+можно скачать в любой момент. Страницы записываются строго по порядку:
+завершённые раньше очереди ждут в небольшом буфере переупорядочивания.
+
+Формат выбирается на каждое сканирование (``WRITERS``). Прежний CSV содержит
+только коды (или ячейки сетки); сжатый CSV, JSON Lines и Parquet содержат все
+столбцы ``COLUMNS``: номер страницы, прямоугольник символа на странице (точки
+PDF, неповёрнутая страница) и время декодирования страницы. Архив по GTIN
+раскладывает коды по файлам товаров через внешнюю сортировку на диске.
+"""
+
+import csv
+import gzip
+import heapq
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from typing import Optional, Sequence
+
+import gtin_gs1
+import gtin_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # необязательный формат
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = "csv"
+
+# Столбцы строки результата. Строки передаются кортежами в этом порядке;
+# у сетки после номера страницы добавляются строка и столбец ячейки
+COLUMNS = ("page", "code", "x0", "y0", "x1", "y1", "decode_ms", "source")
+GRID_COLUMNS = ("page", "row", "column", "code", "x0", "y0", "x1", "y1", "decode_ms", "source")
+
+
+class PageWriter:
+    """Запись строк по страницам в порядке номеров.
+
+    Подкласс реализует ``_write_rows``, ``_flush`` и ``_finish``; ``_flushed_bytes`` —
+    размер файла после последней целиком записанной страницы (по нему
+    режется промежуточная копия). Память — только буфер страниц, пришедших
+    раньше очереди.
+    """
+
+    name = ""
+    title = ""
+    suffix = ""
+    options = frozenset()  # параметры конструктора сверх столбцов
+    # Итог записи для статуса сканирования (заполняется при закрытии)
+    note = ""
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def __init__(self, columns: Sequence[str], first_page: int = 0) -> None:
+        self.columns = tuple(columns)
+        with tempfile.NamedTemporaryFile(suffix=self.suffix, delete=False) as target:
+            self.path = target.name
+        self._pending: dict[int, list] = {}
+        self._next_page = first_page
+        self._closed = False
+        # Промежуточная копия снимается из потока интерфейса
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self._flushed_bytes = 0
+        # Последняя промежуточная копия: удаляется при следующей и при закрытии
+        self._snapshot_path: Optional[str] = None
+
+    def write_page(self, page_num: int, rows: list) -> None:
+        """Принимает строки страницы; пустой список отмечает страницу без кодов."""
+        with self._lock:
+            self._pending[page_num] = rows
+            while self._next_page in self._pending:
+                rows = self._pending.pop(self._next_page)
+                self._write_rows(rows)
+                self.rows_written += len(rows)
+                self._next_page += 1
+            self._flush()
+
+    def snapshot(self) -> Optional[str]:
+        """Копия уже записанных страниц для скачивания во время сканирования.
+
+        Копируется только часть файла до конца последней записанной страницы:
+        буфер файла может сбросить на диск половину следующей. Предыдущая
+        копия к этому времени уже отдана интерфейсу и удаляется.
+        """
+        with self._lock:
+            self._remove_snapshot()
+            self._snapshot_path = self._snapshot()
+            return self._snapshot_path
+
+    def _remove_snapshot(self) -> None:
+        if self._snapshot_path is not None:
+            try:
+                os.remove(self._snapshot_path)
+            except FileNotFoundError:
+                pass
+            self._snapshot_path = None
+
+    def _snapshot(self) -> str:
+        with tempfile.NamedTemporaryFile(suffix=".partial" + self.suffix, delete=False) as target:
+            pass
+        shutil.copyfile(self.path, target.name)
+        os.truncate(target.name, self._flushed_bytes)
+        return target.name
+
+    def close(self) -> str:
+        """Дописывает страницы, оставшиеся в буфере (после пропусков), и закрывает файл."""
+        with self._lock:
+            self._remove_snapshot()
+            if self._closed:
+                return self.path
+            if self._pending:
+                logger.warning(
+                    "Страницы записаны после пропуска %d: %s",
+                    self._next_page + 1,
+                    ", ".join(str(page + 1) for page in sorted(self._pending)),
+                )
+                for page_num in sorted(self._pending):
+                    rows = self._pending.pop(page_num)
+                    self._write_rows(rows)
+                    self.rows_written += len(rows)
+            self._finish()
+            self._closed = True
+            return self.path
+
+    def _write_rows(self, rows: list) -> None:
+        raise NotImplementedError
+
+    def _flush(self) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        raise NotImplementedError
+
+
+class _TextWriter(PageWriter):
+    """Текстовый файл, сбрасываемый на диск после каждой страницы."""
+
+    def __init__(self, columns: Sequence[str], first_page: int = 0) -> None:
+        super().__init__(columns, first_page)
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+
+    def _flush(self) -> None:
+        self._file.flush()
+        self._flushed_bytes = self._file.tell()
+
+    def _finish(self) -> None:
+        self._file.close()
+
+
+class StreamingCsvWriter(_TextWriter):
+    """Прежний формат: один код на строку без экранирования, для сетки —
+    CSV ``page,row,column,code``. Прочие столбцы не записываются."""
+
+    name = "csv"
+    title = "CSV (только коды)"
+    suffix = ".csv"
+
+    def __init__(self, columns: Sequence[str] = COLUMNS, first_page: int = 0) -> None:
+        super().__init__(columns, first_page)
+        self._grid = "row" in self.columns
+        if self._grid:
+            self._fields = [self.columns.index(name) for name in GRID_COLUMNS[:4]]
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(GRID_COLUMNS[:4])
+        else:
+            self._code = self.columns.index("code")
+        self._flush()
+
+    def _write_rows(self, rows: list) -> None:
+        if self._grid:
+            self._csv.writerows([row[index] for index in self._fields] for row in rows)
+        else:
+            self._file.writelines(row[self._code] + "\n" for row in rows)
+
+
+class JsonLinesWriter(_TextWriter):
+    """JSON Lines: объект со всеми столбцами на строку; GS экранируется как ``\\u001d``."""
+
+    name = "jsonl"
+    title = "JSON Lines (страница, положение, время)"
+    suffix = ".jsonl"
+
+    def _write_rows(self, rows: list) -> None:
+        self._file.writelines(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+
+
+class GzipCsvWriter(PageWriter):
+    """CSV со всеми столбцами в gzip.
+
+    Строки копятся в памяти до ``MEMBER_BYTES`` и сжимаются отдельным
+    gzip-членом: файл из нескольких членов читается gzip, Python и pandas как
+    один поток, а каждый записанный член уже самодостаточен. Промежуточная
+    копия — записанные члены плюс сжатый остаток буфера.
+    """
+
+    name = "csv.gz"
+    title = "CSV в gzip (страница, положение, время)"
+    suffix = ".csv.gz"
+
+    MEMBER_BYTES = 1 << 20
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, columns: Sequence[str], first_page: int = 0) -> None:
+        super().__init__(columns, first_page)
+        self._file = open(self.path, "wb")
+        self._buffer = io.StringIO(newline="")
+        self._csv = csv.writer(self._buffer)
+        self._csv.writerow(self.columns)
+
+    def _write_rows(self, rows: list) -> None:
+        self._csv.writerows(rows)
+
+    def _flush(self) -> None:
+        if self._buffer.tell() >= self.MEMBER_BYTES:
+            self._write_member()
+
+    def _write_member(self) -> None:
+        text = self._buffer.getvalue()
+        if text:
+            self._file.write(gzip.compress(text.encode("utf-8"), self.COMPRESS_LEVEL))
+            self._file.flush()
+            self._flushed_bytes = self._file.tell()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def _snapshot(self) -> str:
+        path = super()._snapshot()
+        tail = self._buffer.getvalue()
+        if tail:
+            with open(path, "ab") as target:
+                target.write(gzip.compress(tail.encode("utf-8"), self.COMPRESS_LEVEL))
+        return path
+
+    def _finish(self) -> None:
+        self._write_member()
+        self._file.close()
+
+
+class ParquetWriter(PageWriter):
+    """Parquet (pyarrow): строки копятся до ``ROW_GROUP_ROWS`` и пишутся группой строк.
+
+    Файл Parquet читается только после записи заключительного блока
+    метаданных, поэтому промежуточная копия недоступна.
+    """
+
+    name = "parquet"
+    title = "Parquet (страница, положение, время)"
+    suffix = ".parquet"
+
+    ROW_GROUP_ROWS = 65536
+    COMPRESSION = "zstd"
+
+    @staticmethod
+    def available() -> bool:
+        return pa is not None
+
+    def __init__(self, columns: Sequence[str], first_page: int = 0) -> None:
+        super().__init__(columns, first_page)
+        types = {
+            "page": pa.int32(),
+            "row": pa.int16(),
+            "column": pa.int16(),
+            "code": pa.string(),
+            "decode_ms": pa.float32(),
+            "source": pa.string(),
+        }
+        self._schema = pa.schema([(name, types.get(name, pa.float32())) for name in self.columns])
+        self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.COMPRESSION)
+        self._rows: list = []
+
+    def _write_rows(self, rows: list) -> None:
+        self._rows.extend(rows)
+
+    def _flush(self) -> None:
+        if len(self._rows) >= self.ROW_GROUP_ROWS:
+            self._write_row_group()
+
+    def _write_row_group(self) -> None:
+        if not self._rows:
+            return
+        arrays = [
+            pa.array(values, type=field.type)
+            for values, field in zip(zip(*self._rows), self._schema)
+        ]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._rows = []
+
+    def snapshot(self) -> Optional[str]:
+        return None
+
+    def _finish(self) -> None:
+        self._write_row_group()
+        self._writer.close()
+
+
+class GtinZipWriter(PageWriter):
+    """Архив ZIP с отдельным файлом кодов на каждый GTIN (AI 01), коды
+    отсортированы и без повторов.
+
+    Внешняя сортировка: коды копятся в компактном хранилище
+    (``gtin_store.CodeStore``), затем сортируются по GTIN и коду и
+    сбрасываются на диск отрезками из строк ``GTIN<TAB>код``. Сортировка
+    создаёт объект ``bytes`` на каждый код, поэтому в ``memory_limit_mb``
+    входит и она: хранилище заполняется до ``1 - SORT_SHARE`` лимита, а
+    сортируется за раз столько строк, сколько помещается в остаток; каждая
+    такая порция — отдельный отрезок. При закрытии отрезки сливаются (k-путевое слияние ``heapq.merge``, не
+    больше ``MAX_MERGE_RUNS`` открытых файлов за проход), и поток, уже
+    упорядоченный по GTIN, пишется в архив файл за файлом. Архив появляется
+    только после завершения, поэтому промежуточная копия недоступна.
+    """
+
+    name = "gtin.zip"
+    title = "ZIP: файл на каждый GTIN (сортировка, без повторов)"
+    suffix = ".zip"
+    options = frozenset({"memory_limit_mb"})
+
+    DEFAULT_MEMORY_MB = 256
+    MAX_MERGE_RUNS = 64
+    # Доля лимита памяти под сортировку порции при сбросе на диск
+    SORT_SHARE = 0.25
+    # Память на строку порции сверх её длины: заголовок bytes, выравнивание
+    # распределителя, ссылки в списке и временном буфере сортировки
+    LINE_OVERHEAD = 64
+
+    def __init__(
+        self, columns: Sequence[str], first_page: int = 0, memory_limit_mb: Optional[float] = None
+    ) -> None:
+        super().__init__(columns, first_page)
+        self._code = self.columns.index("code")
+        self._page = self.columns.index("page")
+        self._memory_limit = int((memory_limit_mb or self.DEFAULT_MEMORY_MB) * (1 << 20))
+        self._runs_dir = tempfile.TemporaryDirectory(prefix="gtin_runs_")
+        self._runs: list[str] = []
+        self._run_count = 0
+        self._store = gtin_store.CodeStore()
+
+    @staticmethod
+    def _gtin(code: str) -> Optional[str]:
+        # Канонический код почти всегда начинается с 01; иначе — полный разбор
+        if code.startswith("01"):
+            return code[2:16]
+        fields = gtin_gs1.parse(code)
+        return dict(fields).get("01") if fields else None
+
+    def _write_rows(self, rows: list) -> None:
+        for row in rows:
+            code = row[self._code]
+            gtin = self._gtin(code) if code else None
+            if gtin is None:
+                continue
+            self._store.append(code, row[self._page], gtin)
+
+    def _flush(self) -> None:
+        if self._store.nbytes >= self._memory_limit * (1 - self.SORT_SHARE):
+            self._spill()
+
+    def _new_run(self) -> str:
+        path = os.path.join(self._runs_dir.name, f"run{self._run_count:05d}.txt")
+        self._run_count += 1
+        self._runs.append(path)
+        return path
+
+    def _spill(self) -> None:
+        """Сортирует буфер и сбрасывает его на диск отрезками.
+
+        Строки создаются порциями в порядке GTIN; порция, занявшая остаток
+        лимита памяти, сортируется и пишется отдельным отрезком.
+        """
+        store = self._store
+        if not len(store):
+            return
+        groups = sorted(store.by_gtin().items())
+        # Хранилище и индексы групп остаются в памяти, пока идёт сброс; если
+        # последняя страница переполнила хранилище, порции не меньше половины доли
+        budget = max(
+            self._memory_limit - store.nbytes - 4 * len(store),
+            self._memory_limit * self.SORT_SHARE / 2,
+        )
+        runs = self._run_count
+        lines: list = []
+        used = 0
+        for gtin, indices in groups:
+            prefix = gtin.encode("ascii") + b"\t"
+            for index in indices:
+                line = prefix + store.code_bytes(index) + b"\n"
+                lines.append(line)
+                used += len(line) + self.LINE_OVERHEAD
+                if used >= budget:
+                    self._write_run(lines)
+                    lines = []
+                    used = 0
+        self._write_run(lines)
+        logger.debug(
+            "Сброс %d кодов (%d байт) в отрезков: %d",
+            len(store),
+            store.nbytes,
+            self._run_count - runs,
+        )
+        self._store = gtin_store.CodeStore()
+
+    def _write_run(self, lines: list) -> None:
+        if not lines:
+            return
+        lines.sort()
+        with open(self._new_run(), "wb") as run:
+            run.writelines(lines)
+
+    def _merge_runs(self, paths: list, target: str) -> None:
+        files = [open(path, "rb") for path in paths]
+        try:
+            with open(target, "wb") as merged:
+                merged.writelines(heapq.merge(*files))
+        finally:
+            for file in files:
+                file.close()
+        for path in paths:
+            os.remove(path)
+
+    def snapshot(self) -> Optional[str]:
+        return None
+
+    def _finish(self) -> None:
+        try:
+            self._spill()
+            # Слишком много отрезков сливаются группами, чтобы не упереться в лимит файлов
+            while len(self._runs) > self.MAX_MERGE_RUNS:
+                group = self._runs[: self.MAX_MERGE_RUNS]
+                self._runs = self._runs[self.MAX_MERGE_RUNS :]
+                self._merge_runs(group, self._new_run())
+            self._write_archive()
+        finally:
+            self._runs_dir.cleanup()
+
+    def _write_archive(self) -> None:
+        files = [open(path, "rb") for path in self._runs]
+        gtins = duplicates = 0
+        try:
+            with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as archive:
+                entry = None
+                current = previous = None
+                for line in heapq.merge(*files):
+                    if line == previous:
+                        duplicates += 1
+                        continue
+                    previous = line
+                    gtin, code = line.split(b"\t", 1)
+                    if gtin != current:
+                        if entry is not None:
+                            entry.close()
+                        entry = archive.open(f"{gtin.decode('ascii')}.csv", "w", force_zip64=True)
+                        current = gtin
+                        gtins += 1
+                    entry.write(code)
+                if entry is not None:
+                    entry.close()
+        finally:
+            for file in files:
+                file.close()
+        self.note = f"Архив по GTIN: файлов {gtins}, повторов отброшено {duplicates}"
+        logger.info("%s (отрезков: %d)", self.note, self._run_count)
+
+
+WRITERS = {
+    writer.name: writer
+    for writer in (StreamingCsvWriter, GzipCsvWriter, JsonLinesWriter, ParquetWriter, GtinZipWriter)
+}
+
+
+def available_formats() -> list[str]:
+    """Форматы, библиотеки которых установлены, в порядке регистрации."""
+    return [name for name, writer in WRITERS.items() if writer.available()]
+
+
+def writer_class(name: str) -> type:
+    writer = WRITERS.get(name)
+    if writer is None:
+        raise ValueError(f"Неизвестный формат выгрузки: {name}")
+    if not writer.available():
+        raise ValueError(f"Формат выгрузки {name} недоступен: установите pyarrow")
+    return writer
+
+
+def create_writer(name: str, columns: Sequence[str], **options) -> PageWriter:
+    """Создаёт запись в формате ``name``; параметры, которых формат не понимает, отбрасываются."""
+    writer = writer_class(name)
+    return writer(columns, **{key: value for key, value in options.items() if key in writer.options})
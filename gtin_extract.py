@@ -0,0 +1,322 @@
+"""
+Извлечение Data Matrix из структуры PDF без растеризации страницы
+
+Все области (roi) передаются в неповёрнутых координатах страницы, в которых
+PyMuPDF возвращает геометрию изображений и графики.
+"""
+
+import io
+import logging
+import math
+import re
+from typing import Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageOps
+
+from gtin_gs1 import CRYPTO_TAILS, GS
+
+logger = logging.getLogger(__name__)
+
+# Минимальная сторона изображения, передаваемого декодеру (пиксели)
+MIN_SYMBOL_SIDE = 120
+# Изображение, занимающее большую долю страницы, считается сканом всей страницы
+FULL_PAGE_FRACTION = 0.5
+
+
+def _text_code_pattern(tail) -> tuple:
+    """Регулярное выражение кода с крипто-хвостом ``tail`` и шаблон канонического вида."""
+    regex = r"01(\d{14})21([!-~]{1,20}?)" + "".join(
+        rf"\x1d?{ai}([!-~]{{{length}}})" for ai, length in tail
+    )
+    template = "01{0}21{1}" + "".join(
+        f"{GS}{ai}{{{index}}}" for index, (ai, _) in enumerate(tail, 2)
+    )
+    return re.compile(regex), template
+
+
+# Полные коды в текстовом слое: 01 GTIN, 21 серийный номер и один из
+# крипто-хвостов gtin_gs1.CRYPTO_TAILS. Разделитель GS в тексте может отсутствовать.
+TEXT_CODE_PATTERNS = tuple(map(_text_code_pattern, CRYPTO_TAILS))
+AI_BRACKETS_RE = re.compile(r"\((\d{2,4})\)")
+
+# Векторные символы: допуск выравнивания краёв по сетке (доля шага модуля),
+# пикселей на модуль в собранном растре и ширина тихой зоны в модулях
+GRID_TOLERANCE = 0.2
+VECTOR_PX_PER_MODULE = 4
+QUIET_ZONE_MODULES = 2
+
+
+def classify_region(page, roi) -> set[str]:
+    """Определяет, в каком виде код присутствует в области страницы.
+
+    Возможные значения: ``text`` (полный код в текстовом слое), ``embedded``
+    (отдельное небольшое изображение), ``scan`` (растр всей страницы),
+    ``vector`` (закрашенные векторные прямоугольники).
+    """
+    kinds = set()
+    if text_layer_codes(page, roi):
+        kinds.add("text")
+    if find_roi_image(page, roi) is not None:
+        kinds.add("embedded")
+    if find_page_scan(page, roi) is not None:
+        kinds.add("scan")
+    if _dark_rects(page, roi):
+        kinds.add("vector")
+    return kinds
+
+
+def find_roi_image(page, roi) -> Optional[dict]:
+    """Находит небольшое встроенное изображение, сильнее всего перекрывающее область.
+
+    Возвращает словарь ``page.get_image_info`` или ``None``.
+    """
+    page_area = (page.rect * page.derotation_matrix).get_area()
+    best = None
+    best_overlap = 0.0
+    for info in page.get_image_info(xrefs=True):
+        if info.get("xref", 0) <= 0:
+            # Встроенные (inline) изображения нельзя извлечь по xref
+            continue
+        bbox = fitz.Rect(info["bbox"])
+        if bbox.get_area() > page_area * FULL_PAGE_FRACTION or not bbox.intersects(roi):
+            continue
+        overlap = (bbox & roi).get_area()
+        if overlap > best_overlap:
+            best, best_overlap = info, overlap
+    return best
+
+
+def find_page_scan(page, roi) -> Optional[dict]:
+    """Находит растр, покрывающий страницу (скан), в который попадает область."""
+    page_area = (page.rect * page.derotation_matrix).get_area()
+    best = None
+    for info in page.get_image_info(xrefs=True):
+        if info.get("xref", 0) <= 0:
+            continue
+        bbox = fitz.Rect(info["bbox"])
+        if bbox.get_area() < page_area * FULL_PAGE_FRACTION or not bbox.intersects(roi):
+            continue
+        if best is None or bbox.get_area() > fitz.Rect(best["bbox"]).get_area():
+            best = info
+    return best
+
+
+def scan_region_image(doc, info: dict, roi, min_px_per_pt: float = 3.0) -> Optional[Image.Image]:
+    """Вырезает область из исходного растра скана без повторного рендеринга.
+
+    Область переводится в пиксели изображения через обратную матрицу размещения.
+    JPEG декодируется с уменьшением в DCT (``draft``) сразу в оттенки серого,
+    если разрешение скана выше ``min_px_per_pt`` пикселей на точку; остальные
+    форматы (в том числе двухуровневые CCITT/JBIG2) декодирует MuPDF.
+    """
+    xref = info["xref"]
+    width, height = info["width"], info["height"]
+    bbox = fitz.Rect(info["bbox"])
+    region = roi & bbox
+    if region.is_empty:
+        return None
+    transform = fitz.Matrix(info["transform"])
+    unit = region * ~transform
+    unit.normalize()
+    box = (
+        max(0, math.floor(unit.x0 * width)),
+        max(0, math.floor(unit.y0 * height)),
+        min(width, math.ceil(unit.x1 * width)),
+        min(height, math.ceil(unit.y1 * height)),
+    )
+    if box[2] - box[0] < 8 or box[3] - box[1] < 8:
+        return None
+
+    if _is_plain_jpeg(doc, xref):
+        image = Image.open(io.BytesIO(doc.xref_stream_raw(xref)))
+        px_per_pt = max(width / max(bbox.width, 1e-6), height / max(bbox.height, 1e-6))
+        reduce = min(1.0, min_px_per_pt / px_per_pt)
+        image.draft("L", (math.ceil(width * reduce), math.ceil(height * reduce)))
+        scale = image.width / width
+        image = image.crop(tuple(int(v * scale) for v in box))
+        if image.mode != "L":
+            image = image.convert("L")
+    else:
+        pix = fitz.Pixmap(doc, xref)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        if pix.n != 1:
+            pix = fitz.Pixmap(fitz.csGRAY, pix)
+        # Двухуровневые изображения MuPDF уже отдаёт как 8-битные 0/255
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples_mv).crop(box)
+        del pix
+
+    if transform.a * transform.d - transform.b * transform.c < 0:
+        image = ImageOps.mirror(image)
+    return image
+
+
+def _is_plain_jpeg(doc, xref: int) -> bool:
+    kind, value = doc.xref_get_key(xref, "Filter")
+    return value in ("/DCTDecode", "[/DCTDecode]")
+
+
+def load_symbol_image(doc, info: dict) -> Optional[Image.Image]:
+    """Загружает встроенное изображение в исходном разрешении для декодера.
+
+    Прозрачность накладывается на белый фон, зеркальная трансформация
+    компенсируется, мелкие изображения увеличиваются без сглаживания,
+    вокруг символа добавляется тихая зона.
+    """
+    xref = info["xref"]
+    try:
+        extracted = doc.extract_image(xref)
+    except Exception as exc:
+        logger.debug("Не удалось извлечь изображение xref=%d: %s", xref, exc)
+        return None
+    if not extracted:
+        return None
+
+    try:
+        image = Image.open(io.BytesIO(extracted["image"]))
+        image.load()
+    except Exception:
+        # Форматы, которые PIL не открывает (JBIG2, JPX...), декодирует MuPDF
+        pix = fitz.Pixmap(doc, xref)
+        if pix.n - pix.alpha != 1:
+            pix = fitz.Pixmap(fitz.csGRAY, pix)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples_mv)
+        del pix
+    image = ImageOps.grayscale(image) if image.mode != "L" else image
+
+    smask = extracted.get("smask", 0)
+    if smask:
+        mask_pix = fitz.Pixmap(doc, smask)
+        mask = Image.frombytes("L", (mask_pix.width, mask_pix.height), mask_pix.samples_mv)
+        del mask_pix
+        if mask.size != image.size:
+            mask = mask.resize(image.size, Image.NEAREST)
+        image = Image.composite(image, Image.new("L", image.size, 255), mask)
+
+    a, b, c, d = info["transform"][:4]
+    if a * d - b * c < 0:
+        image = ImageOps.mirror(image)
+
+    return _prepare_for_decoder(image)
+
+
+def _prepare_for_decoder(image: Image.Image) -> Image.Image:
+    side = min(image.size)
+    if 0 < side < MIN_SYMBOL_SIDE:
+        factor = -(-MIN_SYMBOL_SIDE // side)
+        image = image.resize((image.width * factor, image.height * factor), Image.NEAREST)
+    border = max(4, min(image.size) // 10)
+    return ImageOps.expand(image, border=border, fill=255)
+
+
+def vector_symbol_bitmap(page, roi, px_per_module: int = VECTOR_PX_PER_MODULE) -> Optional[Image.Image]:
+    """Собирает растр символа из векторных прямоугольников в области.
+
+    Шаг сетки — наименьшая сторона закрашенного прямоугольника, все края должны
+    ложиться на сетку. Возвращает ``None``, если графика не образует сетку
+    модулей Data Matrix (тогда нужна обычная растеризация). Прямоугольник
+    символа на странице записывается в ``image.info["page_rect"]``.
+    """
+    rects = _dark_rects(page, roi)
+    if not rects or len(rects) < 10:
+        return None
+    edges = np.array([[r.x0, r.y0, r.x1, r.y1] for r in rects], dtype=np.float64)
+    pitch = float(min((edges[:, 2] - edges[:, 0]).min(), (edges[:, 3] - edges[:, 1]).min()))
+    if pitch <= 0:
+        return None
+    origin = np.array([edges[:, 0].min(), edges[:, 1].min()] * 2)
+    units = (edges - origin) / pitch
+    snapped = np.rint(units).astype(np.int64)
+    if np.abs(units - snapped).max() > GRID_TOLERANCE:
+        return None
+
+    cols = int(snapped[:, 2].max())
+    rows = int(snapped[:, 3].max())
+    if not (8 <= cols <= 144 and 8 <= rows <= 144):
+        return None
+    grid = np.zeros((rows, cols), dtype=bool)
+    for c0, r0, c1, r1 in snapped:
+        grid[r0:r1, c0:c1] = True
+    if not _has_finder(grid):
+        return None
+
+    modules = np.where(grid, 0, 255).astype(np.uint8)
+    modules = np.pad(modules, QUIET_ZONE_MODULES, constant_values=255)
+    image = Image.fromarray(modules, mode="L")
+    image = image.resize((image.width * px_per_module, image.height * px_per_module), Image.NEAREST)
+    # Прямоугольник символа на странице (без тихой зоны)
+    x0, y0 = float(origin[0]), float(origin[1])
+    image.info["page_rect"] = (x0, y0, x0 + cols * pitch, y0 + rows * pitch)
+    return image
+
+
+def _is_dark(color) -> bool:
+    if not color:
+        return False
+    if len(color) == 1:
+        luminance = color[0]
+    elif len(color) == 3:
+        luminance = 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
+    else:
+        c, m, y, k = color[:4]
+        luminance = 1.0 - min(1.0, 0.3 * c + 0.59 * m + 0.11 * y + k)
+    return luminance < 0.5
+
+
+def _dark_rects(page, roi) -> Optional[list]:
+    """Тёмные закрашенные прямоугольники в области или ``None``, если там есть иная графика."""
+    rects = []
+    for path in page.get_drawings():
+        if not _is_dark(path.get("fill")) or not fitz.Rect(path["rect"]).intersects(roi):
+            continue
+        for item in path["items"]:
+            if item[0] == "re":
+                rect = fitz.Rect(item[1])
+            elif item[0] == "qu":
+                quad = item[1]
+                rect = quad.rect
+                # Повёрнутый четырёхугольник на сетку не ложится
+                if abs(rect.get_area() - quad.width * quad.height) > 0.01 * rect.get_area():
+                    return None
+            else:
+                return None
+            rect.normalize()
+            if not rect.is_empty and rect.intersects(roi):
+                rects.append(rect)
+    return rects
+
+
+def _has_finder(grid) -> bool:
+    """Проверяет L-образный шаблон поиска: две соседние сплошные стороны."""
+    left, right = grid[:, 0].all(), grid[:, -1].all()
+    top, bottom = grid[0, :].all(), grid[-1, :].all()
+    return (left or right) and (top or bottom)
+
+
+def text_layer_codes(page, roi) -> list[str]:
+    """Ищет в текстовом слое области полные коды маркировки.
+
+    Скобки вокруг идентификаторов применения и пробелы убираются, разделители
+    GS расставляются по структуре кода. Если ни одна строка не подошла,
+    проверяется текст области целиком (код, перенесённый на несколько строк).
+    """
+    lines = [
+        AI_BRACKETS_RE.sub(r"\1", "".join(line.split()))
+        for line in page.get_text("text", clip=roi).splitlines()
+    ]
+    codes = [code for code in map(_match_text_code, lines) if code]
+    if not codes and len(lines) > 1:
+        joined = _match_text_code("".join(lines))
+        if joined:
+            codes.append(joined)
+    return codes
+
+
+def _match_text_code(text: str) -> Optional[str]:
+    for pattern, template in TEXT_CODE_PATTERNS:
+        match = pattern.fullmatch(text)
+        if match:
+            return template.format(*match.groups())
+    return None
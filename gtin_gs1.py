@@ -0,0 +1,271 @@
+"""
+Разбор кодов маркировки по идентификаторам применения GS1 (AI)
+
+Код Честного ЗНАКа — последовательность полей «AI + значение»: 01 (GTIN,
+14 цифр), 21 (серийный номер) и крипто-хвост 91+92 либо 93. Поля переменной
+длины завершаются разделителем GS (0x1D), кроме последнего. Разбор ведётся
+по таблице ``AI_TABLE``; если GS в данных потерян, граница серийного номера
+определяется по известным длинам крипто-хвоста (``CRYPTO_TAILS``), а не по
+первому вхождению «93», которое может оказаться внутри GTIN или серийного номера.
+Поля фиксированной длины из таблицы (17, 3103, 8005) перед хвостом отделяются
+от конца серийного номера, только если без этого код не проходит проверку
+(например, серийный номер длиннее 20 символов): иначе серийный номер вида
+``ABC17251231`` остаётся целым, как в том же коде с GS.
+
+Результат разбора пересобирается в канонический вид с GS после каждого поля
+переменной длины. Код, который не разбирается или у которого не сходится
+контрольная цифра GTIN, считается ошибкой декодирования (``None``).
+"""
+
+import re
+from typing import Iterable, Optional, Union
+
+GS = "\x1d"
+
+# AI: (фиксированная длина значения или None, максимальная длина, только цифры).
+# Для 91/92/93 — предельные длины по требованиям Честного ЗНАКа, а не общие GS1 (90)
+AI_TABLE = {
+    "01": (14, 14, True),  # GTIN
+    "10": (None, 20, False),  # партия
+    "17": (6, 6, True),  # срок годности YYMMDD
+    "21": (None, 20, False),  # серийный номер
+    "91": (None, 4, False),  # ключ проверки
+    "92": (None, 88, False),  # код проверки
+    "93": (None, 4, False),  # код проверки (короткий хвост)
+    "3103": (6, 6, True),  # масса нетто, кг
+    "8005": (6, 6, True),  # цена за единицу
+}
+_AI_LENGTHS = sorted({len(ai) for ai in AI_TABLE}, reverse=True)
+_CRYPTO_AIS = frozenset({"91", "92", "93"})
+# Поля фиксированной длины, которые могут стоять между серийным номером и хвостом;
+# длинные AI проверяются первыми
+_FIXED_AIS = sorted(
+    (ai for ai, (fixed, _, _) in AI_TABLE.items() if fixed is not None and ai != "01"),
+    key=len,
+    reverse=True,
+)
+_DATE_RE = re.compile(r"\d\d(0[1-9]|1[0-2])(0\d|[12]\d|3[01])")
+
+# Крипто-хвосты Честного ЗНАКа: (AI, длина значения). Код без одного из них
+# некорректен; по их длинам восстанавливаются границы полей в данных без GS
+CRYPTO_TAILS = (
+    (("91", 4), ("92", 44)),
+    (("93", 4),),
+    (("91", 4), ("92", 88)),
+)
+
+# Значения AI — символы GS1 из печатного ASCII без пробела
+_VALUE_RE = re.compile(r"[!-~]+")
+
+# Префикс идентификатора символики и FNC1 в начале данных
+_SYMBOLOGY_PREFIX = "]d2"
+_FNC1_BYTE = "\xe8"
+
+_QUOTES = str.maketrans(
+    {
+        "\u201c": '"',
+        "\u201d": '"',
+        "\u201e": '"',
+        "\u201f": '"',
+        "\u2018": "'",
+        "\u2019": "'",
+        "\u201a": "'",
+        "\u201b": "'",
+    }
+)
+# Управляющие символы, кроме GS (в том числе переводы строк), отбрасываются
+_CONTROL_RE = re.compile(r"[\x00-\x1c\x1e\x1f\x7f]")
+_ESCAPE_RE = re.compile(r"""\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|['"\/bfnrt])""")
+_ESCAPES = {
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+    "/": "/",
+    "n": "",
+    "r": "",
+    "t": " ",
+    "b": "",
+    "f": "",
+}
+
+
+def _unescape(match: re.Match) -> str:
+    token = match.group(1)
+    if token in _ESCAPES:
+        return _ESCAPES[token]
+    return chr(int(token[1:], 16))
+
+
+def valid_gtin(gtin: str) -> bool:
+    """Проверяет контрольную цифру GTIN (алгоритм GS1 по модулю 10)."""
+    if not gtin.isdigit() or len(gtin) not in (8, 12, 13, 14):
+        return False
+    digits = [int(ch) for ch in gtin]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits[:-1])))
+    return (10 - total % 10) % 10 == digits[-1]
+
+
+def _clean(raw: Union[bytes, str]) -> str:
+    if isinstance(raw, bytes):
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            text = raw.decode("latin-1")
+    else:
+        text = raw
+    if not text.isascii():
+        text = text.translate(_QUOTES)
+    if "\\" in text:
+        text = _ESCAPE_RE.sub(_unescape, text)
+    if text.startswith(_SYMBOLOGY_PREFIX):
+        text = text[len(_SYMBOLOGY_PREFIX) :]
+    if _FNC1_BYTE in text:
+        text = text.replace(_FNC1_BYTE, GS)
+    return _CONTROL_RE.sub("", text).lstrip(GS)
+
+
+def _match_ai(text: str, pos: int) -> Optional[str]:
+    for length in _AI_LENGTHS:
+        ai = text[pos : pos + length]
+        if ai in AI_TABLE:
+            return ai
+    return None
+
+
+def _parse_separated(text: str) -> Optional[list]:
+    """Разбор по таблице AI: поля фиксированной длины, затем до GS или конца."""
+    fields = []
+    pos = 0
+    while pos < len(text):
+        ai = _match_ai(text, pos)
+        if ai is None:
+            return None
+        fixed, max_len, _ = AI_TABLE[ai]
+        start = pos + len(ai)
+        if fixed is not None:
+            end = start + fixed
+            if end > len(text):
+                return None
+        else:
+            end = text.find(GS, start)
+            if end == -1:
+                end = len(text)
+            if end - start > max_len:
+                return None
+        fields.append((ai, text[start:end]))
+        pos = end + 1 if end < len(text) and text[end] == GS else end
+    return fields
+
+
+def _split_fixed(serial: str) -> tuple:
+    """Отделяет от конца серийного номера поля фиксированной длины из ``AI_TABLE``.
+
+    Без GS граница не видна, и такие поля иначе попали бы в серийный номер.
+    Возвращает серийный номер и отделённые поля в исходном порядке.
+    """
+    fields: list = []
+    found = True
+    while found:
+        found = False
+        for ai in _FIXED_AIS:
+            length = len(ai) + AI_TABLE[ai][0]
+            value = serial[-length + len(ai) :]
+            if (
+                len(serial) > length
+                and serial[-length:].startswith(ai)
+                and value.isdigit()
+                and (ai != "17" or _DATE_RE.fullmatch(value))
+            ):
+                fields.insert(0, (ai, value))
+                serial = serial[:-length]
+                found = True
+                break
+    return serial, fields
+
+
+def _parse_unseparated(text: str) -> Optional[list]:
+    """Код без GS: 01 + GTIN + 21 + серийный номер [+ поля фиксированной длины]
+    + крипто-хвост известной длины.
+
+    Поля фиксированной длины отделяются, только если целый серийный номер
+    не проходит проверку: граница без GS не видна, и разбиение меняло бы
+    серийный номер, который в коде с GS кончается на «17» + дата.
+    """
+    if not text.startswith("01") or text[16:18] != "21":
+        return None
+    body = text[18:]
+    for tail in CRYPTO_TAILS:
+        tail_len = sum(len(ai) + length for ai, length in tail)
+        serial_len = len(body) - tail_len
+        if serial_len < 1:
+            continue
+        tail_fields = []
+        pos = serial_len
+        for ai, length in tail:
+            if body[pos : pos + len(ai)] != ai:
+                break
+            tail_fields.append((ai, body[pos + len(ai) : pos + len(ai) + length]))
+            pos += len(ai) + length
+        else:
+            gtin = ("01", text[2:16])
+            fields = [gtin, ("21", body[:serial_len])] + tail_fields
+            if _valid(fields):
+                return fields
+            serial, fixed_fields = _split_fixed(body[:serial_len])
+            if fixed_fields:
+                fields = [gtin, ("21", serial)] + fixed_fields + tail_fields
+                if _valid(fields):
+                    return fields
+    return None
+
+
+def _valid(fields: list) -> bool:
+    seen = dict(fields)
+    if len(seen) != len(fields) or "01" not in seen or "21" not in seen:
+        return False
+    if not valid_gtin(seen["01"]):
+        return False
+    tail = tuple((ai, len(value)) for ai, value in fields if ai in _CRYPTO_AIS)
+    if tail not in CRYPTO_TAILS:
+        return False
+    for ai, value in fields:
+        fixed, max_len, numeric = AI_TABLE[ai]
+        if not value or len(value) > max_len or not _VALUE_RE.fullmatch(value):
+            return False
+        if numeric and not value.isdigit():
+            return False
+    return True
+
+
+def parse(raw: Union[bytes, str]) -> Optional[list]:
+    """Разбирает код на поля ``[(AI, значение), ...]``; ``None`` — код некорректен."""
+    text = _clean(raw)
+    fields = _parse_separated(text)
+    if fields is None or not _valid(fields):
+        # GS потерян целиком или частично: серийный номер GS не содержит,
+        # поэтому границы восстанавливаются по длинам крипто-хвоста
+        fields = _parse_unseparated(text.replace(GS, ""))
+    if fields is None or not _valid(fields):
+        return None
+    return fields
+
+
+def canonical(fields: list) -> str:
+    """Собирает код из полей: GS после каждого поля переменной длины, кроме последнего."""
+    parts = []
+    for index, (ai, value) in enumerate(fields):
+        parts.append(ai + value)
+        if AI_TABLE[ai][0] is None and index < len(fields) - 1:
+            parts.append(GS)
+    return "".join(parts)
+
+
+def normalize(raw: Union[bytes, str]) -> Optional[str]:
+    """Канонический код или ``None``, если данные не разбираются как код маркировки."""
+    fields = parse(raw)
+    return canonical(fields) if fields is not None else None
+
+
+def normalize_batch(raws: Iterable[Union[bytes, str]]) -> list:
+    """Нормализует коды страницы или блока одним вызовом; некорректные — ``None``."""
+    return [normalize(raw) for raw in raws]
@@ -0,0 +1,196 @@
+"""
+Прямая привязка к libdmtx с переиспользуемым состоянием декодера
+
+pylibdmtx на каждый вызов создаёт и уничтожает ``DmtxImage`` и ``DmtxDecode``
+(с выделением кэша размером с изображение), копирует пиксели в ``bytes`` и
+перебирает все области изображения. Здесь структуры создаются один раз для
+каждого размера области и потока: для следующей области того же размера
+подменяется только указатель на пиксели, а кэш посещённых пикселей и сетка
+поиска сбрасываются к исходному состоянию. Пиксели передаются по указателю
+(например, ``pix.samples_ptr`` или буфер массива NumPy) без копирования.
+Сканер передаёт сюда массив NumPy после предобработки; изображения PIL
+бэкенд ``libdmtx-native`` копирует через ``tobytes()``.
+
+Функции libdmtx вызываются через ctypes, который отпускает GIL только на время
+каждого отдельного вызова, а не всего декодирования: поиск области и
+декодирование матрицы идут параллельно в потоках, а связующий код на Python
+между вызовами (несколько операций с указателями на область) выполняется под GIL.
+
+Используется та же библиотека ``libdmtx0b``, что и у pylibdmtx, и её
+описания структур (они учитывают разницу раскладки между версиями 0.7.4 и 0.7.5).
+"""
+
+import ctypes
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+try:
+    from pylibdmtx import wrapper as dmtx
+    from pylibdmtx.pylibdmtx import Decoded, Rect
+except ImportError:  # libdmtx не найдена — привязка недоступна
+    dmtx = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько наборов структур (разных размеров области) держит один поток
+MAX_STATES_PER_THREAD = 4
+
+_PACK_ORDER = (
+    {
+        8: dmtx.DmtxPackOrder.DmtxPack8bppK,
+        24: dmtx.DmtxPackOrder.DmtxPack24bppRGB,
+        32: dmtx.DmtxPackOrder.DmtxPack32bppRGBX,
+    }
+    if dmtx is not None
+    else {}
+)
+
+# Параметры в порядке аргументов pylibdmtx.decode и соответствующие свойства libdmtx
+_PROPERTIES = (
+    ("gap_size", "DmtxPropScanGap"),
+    ("shape", "DmtxPropSymbolSize"),
+    ("deviation", "DmtxPropSquareDevn"),
+    ("threshold", "DmtxPropEdgeThresh"),
+    ("min_edge", "DmtxPropEdgeMin"),
+    ("max_edge", "DmtxPropEdgeMax"),
+)
+
+
+def available() -> bool:
+    return dmtx is not None
+
+
+class _DecoderState:
+    """``DmtxImage`` и ``DmtxDecode`` для областей одного размера и одних параметров."""
+
+    def __init__(self, width: int, height: int, bpp: int, shrink: int, properties: tuple) -> None:
+        # dmtxImageCreate отвергает NULL; настоящий адрес подставляется в reset()
+        self._placeholder = (ctypes.c_ubyte * 1)()
+        self.image = dmtx.dmtxImageCreate(
+            ctypes.cast(self._placeholder, dmtx.c_ubyte_p), width, height, _PACK_ORDER[bpp]
+        )
+        if not self.image:
+            raise MemoryError("libdmtx: не удалось создать DmtxImage")
+        self.decoder = dmtx.dmtxDecodeCreate(self.image, shrink)
+        if not self.decoder:
+            dmtx.dmtxImageDestroy(ctypes.byref(self.image))
+            raise MemoryError("libdmtx: не удалось создать DmtxDecode")
+        for (_, prop), value in zip(_PROPERTIES, properties):
+            if value is not None:
+                dmtx.dmtxDecodeSetProp(self.decoder, getattr(dmtx.DmtxProperty, prop), value)
+        self.shrink = shrink
+        self.cache_size = (width // shrink) * (height // shrink)
+        # Сетка поиска после установки свойств — к ней возвращаемся перед каждым вызовом
+        self.initial_grid = dmtx.DmtxScanGrid.from_buffer_copy(self.decoder.contents.grid)
+
+    def reset(self, address: int) -> None:
+        self.image.contents.pxl = ctypes.cast(address, dmtx.c_ubyte_p)
+        decoder = self.decoder.contents
+        ctypes.memset(decoder.cache, 0, self.cache_size)
+        decoder.grid = self.initial_grid
+
+    def __del__(self) -> None:
+        if getattr(self, "decoder", None):
+            dmtx.dmtxDecodeDestroy(ctypes.byref(self.decoder))
+        if getattr(self, "image", None):
+            dmtx.dmtxImageDestroy(ctypes.byref(self.image))
+
+
+class NativeDecoder:
+    """Декодер libdmtx с состоянием, переиспользуемым между вызовами.
+
+    Параметры ``decode`` совпадают с ``pylibdmtx.decode``, включая
+    неограниченный по умолчанию ``max_count``. Состояние хранится отдельно для
+    каждого потока, поэтому один экземпляр можно вызывать из пула.
+    """
+
+    def __init__(self) -> None:
+        if dmtx is None:
+            raise RuntimeError("libdmtx не найдена")
+        self._local = threading.local()
+
+    def _state(self, width, height, bpp, shrink, properties) -> _DecoderState:
+        states = getattr(self._local, "states", None)
+        if states is None:
+            states = self._local.states = OrderedDict()
+        key = (width, height, bpp, shrink, properties)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _DecoderState(width, height, bpp, shrink, properties)
+            if len(states) > MAX_STATES_PER_THREAD:
+                states.popitem(last=False)
+        else:
+            states.move_to_end(key)
+        return state
+
+    def decode(
+        self,
+        pixels,
+        width: int,
+        height: int,
+        bpp: int = 8,
+        timeout: Optional[int] = None,
+        shrink: int = 1,
+        corrections: Optional[int] = None,
+        max_count: Optional[int] = None,
+        **properties,
+    ) -> list:
+        """Декодирует пиксели по адресу или из непрерывного массива ``uint8``.
+
+        ``pixels`` — целый адрес буфера (``pix.samples_ptr``) либо массив NumPy;
+        буфер должен жить до конца вызова. Остальные параметры — как у
+        ``pylibdmtx.decode`` (``gap_size``, ``shape``, ``deviation``,
+        ``threshold``, ``min_edge``, ``max_edge``).
+        """
+        if bpp not in _PACK_ORDER:
+            raise ValueError(f"Неподдерживаемая глубина пикселя: {bpp} бит")
+        if isinstance(pixels, np.ndarray):
+            if not pixels.flags.c_contiguous or pixels.nbytes != width * height * bpp // 8:
+                raise ValueError("Массив пикселей должен быть непрерывным и совпадать с размером")
+            address = pixels.ctypes.data
+        else:
+            address = int(pixels)
+        unknown = set(properties) - {name for name, _ in _PROPERTIES}
+        if unknown:
+            raise TypeError(f"Неизвестные параметры libdmtx: {', '.join(sorted(unknown))}")
+        values = tuple(properties.get(name) for name, _ in _PROPERTIES)
+        state = self._state(width, height, bpp, shrink or 1, values)
+        state.reset(address)
+
+        deadline = dmtx.dmtxTimeAdd(dmtx.dmtxTimeNow(), timeout) if timeout else None
+        corrections = corrections or dmtx.DmtxUndefined
+        results = []
+        while not max_count or len(results) < max_count:
+            region = dmtx.dmtxRegionFindNext(state.decoder, deadline)
+            if not region:
+                break
+            try:
+                decoded = self._decode_region(state, region, corrections)
+            finally:
+                dmtx.dmtxRegionDestroy(ctypes.byref(region))
+            if decoded is not None:
+                results.append(decoded)
+        return results
+
+    @staticmethod
+    def _decode_region(state: _DecoderState, region, corrections: int):
+        message = dmtx.dmtxDecodeMatrixRegion(state.decoder, region, corrections)
+        if not message:
+            return None
+        try:
+            # Углы символа в пикселях исходного изображения (как в pylibdmtx)
+            p00 = dmtx.DmtxVector2()
+            p11 = dmtx.DmtxVector2(1.0, 1.0)
+            dmtx.dmtxMatrix3VMultiplyBy(p00, region.contents.fit2raw)
+            dmtx.dmtxMatrix3VMultiplyBy(p11, region.contents.fit2raw)
+            x0 = int(state.shrink * p00.X + 0.5)
+            y0 = int(state.shrink * p00.Y + 0.5)
+            x1 = int(state.shrink * p11.X + 0.5)
+            y1 = int(state.shrink * p11.Y + 0.5)
+            return Decoded(ctypes.string_at(message.contents.output), Rect(x0, y0, x1 - x0, y1 - y0))
+        finally:
+            dmtx.dmtxMessageDestroy(ctypes.byref(message))
@@ -0,0 +1,185 @@
+"""
+Грубый поиск Data Matrix на странице в низком разрешении
+
+Символ Data Matrix — плотная текстура с частыми переходами тёмное/светлое по обеим
+осям и L-образным шаблоном поиска (две соседние сплошные стороны). Поиск идёт
+по сетке ячеек: плотность переходов считается векторно для всей страницы,
+соседние плотные ячейки объединяются в кандидатов, и кандидаты проверяются
+на наличие L-шаблона.
+"""
+
+import logging
+from typing import Optional
+
+import numpy as np
+
+import gtin_preprocess
+
+logger = logging.getLogger(__name__)
+
+# Размер ячейки сетки (пиксели) и пороги плотности переходов на пиксель
+CELL_SIZE = 4
+MIN_TRANSITION_DENSITY = 0.12
+DARK_FRACTION_RANGE = (0.2, 0.8)
+# Минимальная сторона кандидата в ячейках и допустимое соотношение сторон
+MIN_CANDIDATE_CELLS = 3
+ASPECT_RANGE = (0.4, 2.5)
+# Сплошная сторона L-шаблона: доля тёмных пикселей вдоль стороны
+SOLID_EDGE_FRACTION = 0.75
+MAX_CANDIDATES = 8
+
+
+def locate_symbols(gray: np.ndarray, max_candidates: int = MAX_CANDIDATES) -> list:
+    """Ищет прямоугольники-кандидаты Data Matrix в изображении страницы.
+
+    Возвращает список ``(x0, y0, x1, y1)`` в пикселях изображения по убыванию
+    площади: кандидаты с подтверждённым L-шаблоном, а если таких нет — все
+    плотные области подходящей формы (шаблон мог размыться при низком разрешении).
+    """
+    height, width = gray.shape
+    cell = CELL_SIZE
+    rows, cols = (height - 1) // cell, (width - 1) // cell
+    if rows < MIN_CANDIDATE_CELLS or cols < MIN_CANDIDATE_CELLS:
+        return []
+
+    dark = gray <= gtin_preprocess.otsu_threshold(gray)
+    trans_x = dark[:, 1:] != dark[:, :-1]
+    trans_y = dark[1:, :] != dark[:-1, :]
+    shape = (rows, cell, cols, cell)
+    density_x = trans_x[: rows * cell, : cols * cell].reshape(shape).mean(axis=(1, 3))
+    density_y = trans_y[: rows * cell, : cols * cell].reshape(shape).mean(axis=(1, 3))
+    dark_fraction = dark[: rows * cell, : cols * cell].reshape(shape).mean(axis=(1, 3))
+    mask = (
+        (density_x > MIN_TRANSITION_DENSITY)
+        & (density_y > MIN_TRANSITION_DENSITY)
+        & (dark_fraction > DARK_FRACTION_RANGE[0])
+        & (dark_fraction < DARK_FRACTION_RANGE[1])
+    )
+    # Сплошные участки внутри символа дают редкие переходы — закрываем их дилатацией
+    mask = _dilate(mask)
+
+    verified, unverified = [], []
+    for r0, c0, r1, c1 in _components(mask):
+        if min(r1 - r0, c1 - c0) < MIN_CANDIDATE_CELLS:
+            continue
+        aspect = (c1 - c0) / (r1 - r0)
+        if not ASPECT_RANGE[0] <= aspect <= ASPECT_RANGE[1]:
+            continue
+        box = _tighten(dark, (int(c0) * cell, int(r0) * cell, (int(c1) + 1) * cell, (int(r1) + 1) * cell))
+        if box is None:
+            continue
+        (verified if _has_l_finder(dark, box) else unverified).append(box)
+
+    candidates = sorted(
+        verified or unverified, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True
+    )
+    logger.debug(
+        "Кандидаты Data Matrix: %d с L-шаблоном, %d без", len(verified), len(unverified)
+    )
+    return candidates[:max_candidates]
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
+
+
+def _components(mask: np.ndarray) -> list:
+    """Связные области (4-связность) маски ячеек: список ``(r0, c0, r1, c1)`` включительно.
+
+    Разметка векторная: маска разбивается на горизонтальные серии, серии
+    соседних строк, перекрывающиеся хотя бы в одном столбце, связываются, и
+    метки серий сводятся к наименьшей в области распространением по рёбрам
+    со сжатием путей. Цикл Python идёт только по итерациям сходимости.
+    """
+    rows, cols = mask.shape
+    padded = np.zeros((rows, cols + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)  # исключительно; порядок тот же, что у начал
+    if not run_rows.size:
+        return []
+
+    # Номер серии для каждой ячейки маски (в порядке обхода по строкам)
+    run_id = np.full(mask.shape, -1, dtype=np.int64)
+    run_id[mask] = np.repeat(np.arange(run_rows.size), run_ends - run_starts)
+    vertical = mask[:-1] & mask[1:]
+    upper = run_id[:-1][vertical]
+    lower = run_id[1:][vertical]
+
+    labels = np.arange(run_rows.size)
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[upper], labels[lower])
+        np.minimum.at(labels, upper, smallest)
+        np.minimum.at(labels, lower, smallest)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+
+    roots, label_index = np.unique(labels, return_inverse=True)
+    count = roots.size
+    r0 = np.full(count, rows, dtype=np.int64)
+    c0 = np.full(count, cols, dtype=np.int64)
+    r1 = np.full(count, -1, dtype=np.int64)
+    c1 = np.full(count, -1, dtype=np.int64)
+    np.minimum.at(r0, label_index, run_rows)
+    np.minimum.at(c0, label_index, run_starts)
+    np.maximum.at(r1, label_index, run_rows)
+    np.maximum.at(c1, label_index, run_ends - 1)
+    return list(zip(r0.tolist(), c0.tolist(), r1.tolist(), c1.tolist()))
+
+
+def _tighten(dark: np.ndarray, box) -> Optional[tuple]:
+    """Сжимает прямоугольник до тёмных пикселей внутри него."""
+    x0, y0, x1, y1 = box
+    x0, y0 = max(x0 - CELL_SIZE, 0), max(y0 - CELL_SIZE, 0)
+    x1, y1 = min(x1 + CELL_SIZE, dark.shape[1]), min(y1 + CELL_SIZE, dark.shape[0])
+    region = dark[y0:y1, x0:x1]
+    cols = np.flatnonzero(region.any(axis=0))
+    rows = np.flatnonzero(region.any(axis=1))
+    if cols.size < 2 or rows.size < 2:
+        return None
+    return (x0 + int(cols[0]), y0 + int(rows[0]), x0 + int(cols[-1]) + 1, y0 + int(rows[-1]) + 1)
+
+
+def _has_l_finder(dark: np.ndarray, box) -> bool:
+    x0, y0, x1, y1 = box
+    region = dark[y0:y1, x0:x1]
+    band = max(1, min(region.shape) // 12)
+
+    def solid(lines) -> bool:
+        return max(float(line.mean()) for line in lines) >= SOLID_EDGE_FRACTION
+
+    top = solid(region[:band, :])
+    bottom = solid(region[-band:, :])
+    left = solid(region[:, :band].T)
+    right = solid(region[:, -band:].T)
+    return (left or right) and (top or bottom)
+
+
+def detect_grid(boxes: list) -> Optional[tuple]:
+    """Число строк и столбцов сетки этикеток по прямоугольникам найденных символов.
+
+    Центры символов группируются по каждой оси: разрыв больше половины
+    медианного размера символа начинает новую строку (столбец).
+    """
+    if len(boxes) < 2:
+        return None
+    sides = sorted(max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes)
+    gap = sides[len(sides) // 2] / 2
+
+    def count(centers) -> int:
+        centers = sorted(centers)
+        return 1 + sum(1 for a, b in zip(centers, centers[1:]) if b - a > gap)
+
+    rows = count((y0 + y1) / 2 for x0, y0, x1, y1 in boxes)
+    cols = count((x0 + x1) / 2 for x0, y0, x1, y1 in boxes)
+    if rows * cols < 2:
+        return None
+    return rows, cols
@@ -0,0 +1,224 @@
+"""
+Варианты предобработки области перед декодированием Data Matrix
+
+Все варианты принимают и возвращают двумерные массивы ``uint8`` в оттенках
+серого, которые передаются в pylibdmtx через ``DecoderPixels`` без копирования.
+Порядок в ``VARIANTS`` — по возрастанию стоимости.
+"""
+
+import ctypes
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ("raw", "otsu", "adaptive", "close", "invert")
+VARIANT_TITLES = {
+    "raw": "оттенки серого",
+    "otsu": "порог Оцу",
+    "adaptive": "адаптивный порог",
+    "close": "морфологическое замыкание",
+    "invert": "инверсия",
+}
+
+# Адаптивный порог: окно — доля меньшей стороны (нечётное, не меньше минимума),
+# пиксель тёмный, если темнее локального среднего на ADAPTIVE_OFFSET уровней
+ADAPTIVE_BLOCK_FRACTION = 0.125
+ADAPTIVE_MIN_BLOCK = 15
+ADAPTIVE_OFFSET = 10
+
+# Растяжение контраста: доля пикселей, отбрасываемых с каждого края гистограммы
+STRETCH_CLIP_FRACTION = 0.01
+# np.bincount приводит вход к intp (8 байт на пиксель), поэтому гистограмма
+# набирается кусками ограниченного размера
+HISTOGRAM_CHUNK = 1 << 15
+
+
+def histogram(gray: np.ndarray) -> np.ndarray:
+    """Гистограмма уровней 0..255 без копии изображения в 64-битные целые."""
+    flat = gray.ravel()
+    hist = np.zeros(256, dtype=np.int64)
+    for start in range(0, flat.size, HISTOGRAM_CHUNK):
+        hist += np.bincount(flat[start : start + HISTOGRAM_CHUNK], minlength=256)
+    return hist
+
+
+def as_gray_array(image) -> np.ndarray:
+    """Массив оттенков серого из изображения PIL с одной копией пикселей (только чтение)."""
+    if image.mode != "L":
+        image = image.convert("L")
+    return np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(image.height, image.width)
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Глобальный порог Оцу: уровни не выше порога относятся к тёмному классу."""
+    hist = histogram(gray).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+class DecoderPixels:
+    """Пиксели массива для ``pylibdmtx.decode((pixels, width, height))`` без копирования.
+
+    pylibdmtx берёт у объекта только длину (для расчёта бит на пиксель) и
+    указатель через ``ctypes.cast``, поэтому буфер NumPy передаётся как есть.
+    Массив должен быть непрерывным и жить до конца декодирования.
+    """
+
+    def __init__(self, array: np.ndarray) -> None:
+        self._array = np.ascontiguousarray(array, dtype=np.uint8)
+        self._as_parameter_ = self._array.ctypes.data_as(ctypes.c_void_p)
+
+    def __len__(self) -> int:
+        return self._array.size
+
+
+class PreprocessEngine:
+    """Слитая предобработка на NumPy в буферах, переиспользуемых между страницами.
+
+    Нерезкое маскирование (рамка 3x3), растяжение контраста и бинаризация по Оцу
+    выполняются операциями ``out=`` над предвыделенными буферами; буферы
+    пересоздаются, только когда область становится больше. Маска считается
+    в 16-битных целых (значения умножены на 9, без деления), при бинаризации
+    растяжение монотонно и сводится к выбору порога. Результат — вид на
+    выходной буфер, действительный до следующего вызова; не потокобезопасно.
+    """
+
+    def __init__(self, amount: int = 1) -> None:
+        # 9 * (1 + amount) * 255 должно помещаться в int16
+        if not 0 <= amount <= 12:
+            raise ValueError(f"Сила нерезкой маски вне диапазона 0..12: {amount}")
+        self.amount = amount
+        self.allocations = 0
+        self._buffers: dict[str, np.ndarray] = {}
+
+    def _buffer(self, name: str, shape, dtype) -> np.ndarray:
+        size = shape[0] * shape[1]
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer[:size].reshape(shape)
+
+    def enhance(self, gray: np.ndarray, binarize: bool = True) -> np.ndarray:
+        """Повышает резкость и контраст, при ``binarize`` — бинаризует (0/255)."""
+        height, width = gray.shape
+        if height < 3 or width < 3:
+            return gray
+        # Порог и границы растяжения считаются до записи в выходной буфер:
+        # на вход может прийти результат предыдущего вызова
+        if binarize:
+            threshold = otsu_threshold(gray)
+        else:
+            low, high = _stretch_bounds(histogram(gray))
+        work = self._buffer("work", gray.shape, np.int16)
+        rows = self._buffer("rows", gray.shape, np.int16)
+        sharp = self._buffer("sharp", gray.shape, np.int16)
+        out = self._buffer("out", gray.shape, np.uint8)
+
+        # Сумма по рамке 3x3: сначала по строкам, затем по столбцам (края повторяются)
+        np.copyto(work, gray)
+        np.add(work[:, :-2], work[:, 1:-1], out=rows[:, 1:-1])
+        np.add(rows[:, 1:-1], work[:, 2:], out=rows[:, 1:-1])
+        np.multiply(work[:, :1], 3, out=rows[:, :1])
+        np.multiply(work[:, -1:], 3, out=rows[:, -1:])
+        np.add(rows[:-2], rows[1:-1], out=sharp[1:-1])
+        np.add(sharp[1:-1], rows[2:], out=sharp[1:-1])
+        np.multiply(rows[:1], 3, out=sharp[:1])
+        np.multiply(rows[-1:], 3, out=sharp[-1:])
+
+        # sharp = 9 * ((1 + amount) * gray - amount * blur), где blur = сумма / 9
+        np.multiply(sharp, -self.amount, out=sharp)
+        np.multiply(work, 9 * (1 + self.amount), out=rows)
+        np.add(sharp, rows, out=sharp)
+
+        if binarize:
+            dark = self._buffer("dark", gray.shape, np.bool_)
+            np.less_equal(sharp, 9 * threshold, out=dark)
+            out.fill(255)
+            np.copyto(out, 0, where=dark)
+            return out
+
+        scale = 255.0 / (high - low)
+        scaled = self._buffer("scaled", gray.shape, np.float32)
+        np.multiply(sharp, np.float32(scale / 9.0), out=scaled)
+        np.subtract(scaled, np.float32(low * scale), out=scaled)
+        np.clip(scaled, 0, 255, out=scaled)
+        np.copyto(out, scaled, casting="unsafe")
+        return out
+
+
+def _stretch_bounds(hist: np.ndarray) -> tuple[int, int]:
+    cumulative = np.cumsum(hist)
+    total = cumulative[-1]
+    low = int(np.searchsorted(cumulative, total * STRETCH_CLIP_FRACTION))
+    high = int(np.searchsorted(cumulative, total * (1.0 - STRETCH_CLIP_FRACTION)))
+    return low, max(high, low + 1)
+
+
+def apply(variant: str, gray: np.ndarray, engine: Optional[PreprocessEngine] = None) -> np.ndarray:
+    """Применяет вариант предобработки; для ``raw`` возвращает тот же массив.
+
+    С ``engine`` порог Оцу выполняется слитно с нерезким маскированием
+    в буферах движка.
+    """
+    if variant == "raw":
+        return gray
+    if variant == "otsu":
+        if engine is not None:
+            return engine.enhance(gray, binarize=True)
+        dark = gray <= otsu_threshold(gray)
+    elif variant == "adaptive":
+        dark = _adaptive_dark(gray)
+    elif variant == "close":
+        dark = _close(gray <= otsu_threshold(gray))
+    elif variant == "invert":
+        return 255 - gray
+    else:
+        raise ValueError(f"Неизвестный вариант предобработки: {variant}")
+    return np.where(dark, 0, 255).astype(np.uint8)
+
+
+def _adaptive_dark(gray: np.ndarray) -> np.ndarray:
+    """Сравнение с локальным средним по окну через интегральное изображение."""
+    height, width = gray.shape
+    block = max(ADAPTIVE_MIN_BLOCK, int(min(height, width) * ADAPTIVE_BLOCK_FRACTION) | 1)
+    radius = block // 2
+    integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+    integral[1:, 1:] = gray.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
+    y0 = np.clip(np.arange(height) - radius, 0, height)
+    y1 = np.clip(np.arange(height) + radius + 1, 0, height)
+    x0 = np.clip(np.arange(width) - radius, 0, width)
+    x1 = np.clip(np.arange(width) + radius + 1, 0, width)
+    sums = (
+        integral[y1][:, x1] - integral[y0][:, x1] - integral[y1][:, x0] + integral[y0][:, x0]
+    )
+    area = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+    return (gray.astype(np.int64) + ADAPTIVE_OFFSET) * area < sums
+
+
+def _close(dark: np.ndarray) -> np.ndarray:
+    """Замыкание 3x3: заполняет разрывы внутри модулей (точечная печать, царапины)."""
+    return ~_dilate(~_dilate(dark))
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    padded = np.pad(mask, 1, mode="edge")
+    height, width = mask.shape
+    grown = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            grown |= padded[dy : dy + height, dx : dx + width]
+    return grown
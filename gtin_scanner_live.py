@@ -5,12 +5,14 @@ GTIN Scanner Live – веб-приложение для извлечения Da
 
 import sys
 import csv
-import io
 import time
 import threading
 import logging
 import os
-import re
+import math
+from contextlib import contextmanager
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Tuple
 import queue
@@ -31,32 +33,451 @@ logging.getLogger().setLevel(LOG_LEVEL)
 try:
     import gradio as gr
     import fitz  # PyMuPDF
-    from pylibdmtx.pylibdmtx import decode
-    from PIL import Image, ImageEnhance
+    from PIL import Image, ImageDraw, ImageEnhance
+    import numpy as np
+    import gtin_decoders
+    import gtin_export
+    import gtin_extract
+    import gtin_gs1
+    import gtin_locator
+    import gtin_preprocess
 except ImportError as e:
     logger.error("Ошибка импорта: %s", e)
     print(f"Ошибка импорта: {e}")
     print("\nУстановите необходимые библиотеки:")
-    print("pip install gradio PyMuPDF pylibdmtx Pillow")
+    print("pip install gradio PyMuPDF pylibdmtx Pillow numpy")
     sys.exit(1)
 
 
+# Распознанный символ: данные, прямоугольник в координатах изображения (как у
+# pylibdmtx) и прямоугольник на неповёрнутой странице в точках PDF
+PlacedSymbol = namedtuple("PlacedSymbol", "data rect bbox")
+
+
+class ZoomCalibrator:
+    """Подбор масштаба рендеринга по размеру модуля Data Matrix.
+
+    На первых успешно распознанных страницах измеряется шаг модуля в точках PDF,
+    после чего для остальных страниц документа выбирается наименьший масштаб,
+    дающий ``target_px`` пикселей на модуль. Если доля распознанных страниц при
+    подобранном масштабе падает ниже ``min_rate``, калибровка отключается.
+    """
+
+    def __init__(
+        self,
+        base_zoom: float,
+        target_px: float,
+        min_zoom: float,
+        max_zoom: float,
+        samples: int = 3,
+        window: int = 20,
+        min_rate: float = 0.9,
+    ) -> None:
+        self.base_zoom = base_zoom
+        self.target_px = target_px
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.samples = samples
+        self.min_rate = min_rate
+        self.pitches_pt: list[float] = []
+        self.zoom: Optional[float] = None
+        self.disabled = False
+        self.recent: "deque[bool]" = deque(maxlen=window)
+
+    @property
+    def calibrating(self) -> bool:
+        return self.zoom is None and not self.disabled
+
+    @property
+    def active(self) -> bool:
+        return self.zoom is not None and not self.disabled
+
+    def current_zoom(self) -> float:
+        return self.zoom if self.active else self.base_zoom
+
+    def add_sample(self, pitch_pt: float) -> None:
+        self.pitches_pt.append(pitch_pt)
+        if len(self.pitches_pt) < self.samples:
+            return
+        # Ориентируемся на самый мелкий модуль, чтобы не потерять страницы
+        zoom = self.target_px / min(self.pitches_pt)
+        self.zoom = max(self.min_zoom, min(self.max_zoom, zoom))
+        logger.info(
+            "Калибровка масштаба: шаг модуля %.2f pt, масштаб %.2fx вместо %.2fx",
+            min(self.pitches_pt),
+            self.zoom,
+            self.base_zoom,
+        )
+
+    def record(self, success: bool) -> None:
+        if not self.active:
+            return
+        self.recent.append(success)
+        if len(self.recent) == self.recent.maxlen:
+            rate = sum(self.recent) / len(self.recent)
+            if rate < self.min_rate:
+                self.disabled = True
+                logger.warning(
+                    "Доля распознавания при масштабе %.2fx упала до %.0f%%, возврат к %.2fx",
+                    self.zoom,
+                    rate * 100,
+                    self.base_zoom,
+                )
+
+
+# Квадратные размеры символов Data Matrix в порядке значений DmtxSymbolSize
+# (DmtxSymbol10x10 = 0, ...), которые libdmtx принимает в параметре shape
+SQUARE_SYMBOL_SIZES = (
+    10, 12, 14, 16, 18, 20, 22, 24, 26, 32, 36, 40,
+    44, 48, 52, 64, 72, 80, 88, 96, 104, 120, 132, 144,
+)
+
+
+class DecoderLock:
+    """Автофиксация параметров libdmtx по первым успешным декодированиям.
+
+    После ``samples`` успешных страниц поиск ограничивается наблюдаемым
+    размером символа, длиной стороны (в точках PDF, пересчитывается в пиксели
+    для текущего масштаба), числом символов на странице и временем декодирования.
+    Время пересчитывается на площадь изображения: на ступенях с большим
+    масштабом и при повторной проверке пикселей больше, чем на первой ступени,
+    где оно наблюдалось. Если доля распознавания с ограничениями падает ниже ``min_rate``,
+    фиксация снимается.
+    """
+
+    def __init__(
+        self,
+        samples: int,
+        edge_margin: float = 0.2,
+        timeout_factor: float = 4.0,
+        min_timeout_ms: int = 50,
+        window: int = 20,
+        min_rate: float = 0.9,
+    ) -> None:
+        self.samples = samples
+        self.edge_margin = edge_margin
+        self.timeout_factor = timeout_factor
+        self.min_timeout_ms = min_timeout_ms
+        self.min_rate = min_rate
+        self.observations: list[tuple] = []
+        self.params: Optional[dict] = None
+        # Площадь изображения (пикселей), для которой наблюдалось время декодирования
+        self.timeout_area = 0
+        self.disabled = False
+        self.recent: "deque[bool]" = deque(maxlen=window)
+
+    @property
+    def collecting(self) -> bool:
+        return self.params is None and not self.disabled
+
+    @property
+    def locked(self) -> bool:
+        return self.params is not None and not self.disabled
+
+    def observe(
+        self,
+        modules: Optional[int],
+        edge_pt: Optional[float],
+        count: int,
+        seconds: float,
+        area: int = 0,
+    ) -> None:
+        self.observations.append((modules, edge_pt, count, seconds, area))
+        if len(self.observations) < self.samples:
+            return
+        sizes = {obs[0] for obs in self.observations}
+        edges = [obs[1] for obs in self.observations if obs[1]]
+        params = {
+            "max_count": max(obs[2] for obs in self.observations),
+            "timeout": max(
+                self.min_timeout_ms,
+                int(max(obs[3] for obs in self.observations) * 1000 * self.timeout_factor),
+            ),
+        }
+        if len(sizes) == 1 and None not in sizes:
+            params["shape"] = SQUARE_SYMBOL_SIZES.index(sizes.pop())
+        if edges:
+            params["edge_pt"] = (
+                min(edges) * (1 - self.edge_margin),
+                max(edges) * (1 + self.edge_margin),
+            )
+        # Самое маленькое из изображений: время на больших пересчитывается с запасом
+        self.timeout_area = min((obs[4] for obs in self.observations if obs[4]), default=0)
+        self.params = params
+        logger.info(
+            "Параметры libdmtx зафиксированы: %s (время — для %d пикселей)",
+            params,
+            self.timeout_area,
+        )
+
+    def decode_kwargs(self, zoom: Optional[float], area: int = 0) -> dict:
+        """Ограничения для изображения площадью ``area`` пикселей при масштабе ``zoom``."""
+        if not self.locked:
+            return {}
+        kwargs = {key: value for key, value in self.params.items() if key != "edge_pt"}
+        if area > self.timeout_area > 0:
+            kwargs["timeout"] = math.ceil(kwargs["timeout"] * area / self.timeout_area)
+        if zoom and "edge_pt" in self.params:
+            low, high = self.params["edge_pt"]
+            kwargs["min_edge"] = max(1, int(low * zoom))
+            kwargs["max_edge"] = math.ceil(high * zoom)
+        return kwargs
+
+    def record(self, success: bool) -> None:
+        if not self.locked:
+            return
+        self.recent.append(success)
+        if len(self.recent) == self.recent.maxlen:
+            rate = sum(self.recent) / len(self.recent)
+            if rate < self.min_rate:
+                self.disabled = True
+                logger.warning(
+                    "Доля распознавания с фиксированными параметрами libdmtx упала до %.0f%%, "
+                    "фиксация снята",
+                    rate * 100,
+                )
+
+
+class SymbolTracker:
+    """Отслеживание положения символа от страницы к странице.
+
+    Хранит последнее найденное положение символов в долях неповёрнутой страницы.
+    Окно поиска — это положение, расширенное на ``margin`` от размера символа
+    с каждой стороны, поэтому небольшой сдвиг печати остаётся внутри окна,
+    а каждая удачная страница обновляет положение.
+    """
+
+    def __init__(self, margin: float = 0.3) -> None:
+        self.margin = margin
+        self.fractions: Optional[Tuple[float, float, float, float]] = None
+
+    def window(self, page, roi) -> Optional["fitz.Rect"]:
+        if self.fractions is None:
+            return None
+        base = page.rect * page.derotation_matrix
+        fx0, fy0, fx1, fy1 = self.fractions
+        rect = fitz.Rect(
+            base.x0 + fx0 * base.width,
+            base.y0 + fy0 * base.height,
+            base.x0 + fx1 * base.width,
+            base.y0 + fy1 * base.height,
+        )
+        dx, dy = rect.width * self.margin, rect.height * self.margin
+        window = fitz.Rect(rect.x0 - dx, rect.y0 - dy, rect.x1 + dx, rect.y1 + dy) & roi
+        if window.is_empty or window.contains(roi):
+            return None
+        return window
+
+    def update(self, page, rect) -> None:
+        base = page.rect * page.derotation_matrix
+        self.fractions = (
+            (rect.x0 - base.x0) / base.width,
+            (rect.y0 - base.y0) / base.height,
+            (rect.x1 - base.x0) / base.width,
+            (rect.y1 - base.y0) / base.height,
+        )
+
+
+class TextLayerShortcut:
+    """Использование кодов из текстового слоя вместо декодирования Data Matrix.
+
+    Первые ``sample`` страниц, где в области найден текст с кодом, сверяются
+    с настоящим декодированием. Текст используется только после 100% совпадений,
+    дальше каждая ``spot_check``-я такая страница проверяется повторно.
+    Любое расхождение отключает текстовый слой до конца документа.
+    """
+
+    def __init__(self, sample: int, spot_check: int) -> None:
+        self.sample = sample
+        self.spot_check = spot_check
+        self.confirmed = 0
+        self.taken = 0
+        self.disabled = False
+
+    @property
+    def active(self) -> bool:
+        return self.confirmed >= self.sample and not self.disabled
+
+    def take_text(self) -> bool:
+        if not self.active:
+            return False
+        self.taken += 1
+        return self.taken % self.spot_check != 0
+
+    def confirm(self, text_codes: list[str], decoded_codes: list[str], page_num: int) -> None:
+        if sorted(text_codes) == sorted(decoded_codes):
+            self.confirmed += 1
+            if self.confirmed == self.sample:
+                logger.info(
+                    "Текстовый слой подтверждён на %d страницах, декодирование пропускается",
+                    self.sample,
+                )
+            return
+        self.disabled = True
+        logger.warning(
+            "Текстовый слой расходится с Data Matrix на странице %d, используется декодирование",
+            page_num + 1,
+        )
+
+
+class PreprocessChain:
+    """Цепочка вариантов предобработки в порядке стоимости.
+
+    Варианты пробуются от дешёвого к дорогому до первого успешного
+    декодирования. Вариант, чаще всего приводивший к успеху в документе,
+    переносится в начало цепочки.
+    """
+
+    def __init__(self, variants) -> None:
+        self.variants = list(variants) or ["raw"]
+        self.wins: Counter = Counter()
+
+    @property
+    def winner(self) -> Optional[str]:
+        return self.wins.most_common(1)[0][0] if self.wins else None
+
+    def order(self, depth: Optional[int] = None) -> list[str]:
+        winner = self.winner
+        variants = self.variants
+        if winner is not None:
+            variants = [winner] + [variant for variant in variants if variant != winner]
+        return variants[:depth]
+
+    def record(self, variant: str) -> None:
+        leader = self.winner
+        self.wins[variant] += 1
+        if self.winner != leader:
+            logger.info("Предобработка документа: первым пробуется вариант %s", self.winner)
+
+
 class GTINScanner:
     """Основная логика сканера GTIN."""
 
-    ESCAPE_RE = re.compile(
-        r"""\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|['"\/bfnrt])"""
+    PREVIEW_ZOOM = 2.0
+    SCAN_ZOOM = 3.0
+
+    # Профили рендеринга для сканирования. aa_level — уровень сглаживания MuPDF
+    # (0 = выключено, 8 = максимум), sharpen — повышать ли контраст и резкость
+    # после рендера перед цепочкой предобработки.
+    RENDER_PROFILES = {
+        "barcode": {
+            "title": "Штрихкод: оттенки серого, без сглаживания и аннотаций",
+            "colorspace": fitz.csGRAY,
+            "alpha": False,
+            "aa_level": 0,
+            "annots": False,
+            "sharpen": False,
+        },
+        "rgb": {
+            "title": "RGB со сглаживанием (прежний режим)",
+            "colorspace": fitz.csRGB,
+            "alpha": False,
+            "aa_level": 8,
+            "annots": True,
+            "sharpen": True,
+        },
+    }
+    DEFAULT_RENDER_PROFILE = "barcode"
+
+    # Адаптивный масштаб: сколько пикселей должно приходиться на модуль Data Matrix
+    TARGET_PX_PER_MODULE = 4.0
+    CALIBRATION_PAGES = 3
+    MIN_SCAN_ZOOM = 0.5
+    MAX_SCAN_ZOOM = 8.0
+
+    # Лестница эскалации: (масштаб, глубина цепочки предобработки). Следующая
+    # ступень пробуется только если предыдущая не дала ни одного кода; на каждой
+    # ступени область рендерится один раз, и по порядку цепочки пробуются первые
+    # «глубина» вариантов (None — все).
+    ESCALATION_LADDER = (
+        (1.5, 1),
+        (3.0, 2),
+        (4.5, 3),
+        (6.0, None),
     )
+    DEFAULT_MAX_ZOOM = 6.0
+
+    # Сколько страниц подряд без успеха пробовать стратегию, прежде чем
+    # отключить её до конца документа
+    STRATEGY_PROBE_PAGES = 5
+
+    # Текстовый слой: сколько страниц сверить с декодированием перед тем, как
+    # доверять тексту, и как часто перепроверять после этого
+    TEXT_CONFIRM_PAGES = 10
+    TEXT_SPOT_CHECK_EVERY = 100
+
+    # Предварительный анализ: число пробных страниц и стратегии в порядке стоимости.
+    # render — обычная лестница рендеринга, она же эталон для сверки.
+    PREFLIGHT_SAMPLES = 5
+
+    # Параметры pylibdmtx.decode, настраиваемые в интерфейсе (0 или пусто — по умолчанию)
+    DECODER_PARAMS = (
+        "timeout",
+        "max_count",
+        "shrink",
+        "gap_size",
+        "deviation",
+        "threshold",
+        "min_edge",
+        "max_edge",
+    )
+    DECODER_LOCK_PAGES = 5
+
+    # Поиск по всей странице: масштаб грубого рендеринга для локатора и поля
+    # вокруг кандидата (доля его большей стороны) для тихой зоны
+    LOCATOR_ZOOM = 1.5
+    LOCATOR_MARGIN = 0.15
+
+    # Пакетное декодирование: области нескольких страниц в одной мозаике.
+    # Промежуток между клетками — доля большей стороны клетки, не меньше минимума (px)
+    DEFAULT_MOSAIC_PAGES = 0
+    MAX_MOSAIC_PAGES = 64
+    MOSAIC_GUTTER = 0.1
+    MOSAIC_MIN_GUTTER = 16
+
+    # Листы с несколькими этикетками: область делится на сетку, ячейки
+    # декодируются параллельно. Для автоопределения сетки локатору разрешено
+    # вернуть больше кандидатов, чем при обычном поиске.
+    GRID_WORKERS = min(8, os.cpu_count() or 1)
+    GRID_MAX_CANDIDATES = 400
+    GRID_MISSING_SHOWN = 5
+
+    # Автоматическое предложение области при загрузке: сколько первых страниц
+    # просмотреть, запас вокруг найденных символов (доля большей стороны) и
+    # бюджет времени: загрузка не должна ждать плотный или нечитаемый PDF
+    ROI_PROPOSAL_PAGES = 3
+    ROI_PROPOSAL_MARGIN = 0.5
+    ROI_PROPOSAL_SECONDS = 2.0
+    STRATEGY_TITLES = {
+        "text": "текстовый слой",
+        "embedded": "встроенное изображение",
+        "vector": "векторная графика",
+        "scan": "скан страницы",
+        "render": "рендеринг области",
+    }
 
     def __init__(self) -> None:
         self.pdf_document = None
         self.pdf_path: Optional[str] = None
         self.crop_rect: Optional[Tuple[int, int, int, int]] = None
+        # Область в долях неповёрнутой страницы: (x0, y0, x1, y1) в диапазоне 0..1
+        self.roi_fractions: Optional[Tuple[float, float, float, float]] = None
         self.stop_requested = False
         self.preview_image = None
         self.selection_start = None
         self.selection_end = None
         self.scanning = False
+        self.preflight_result: Optional[dict] = None
+        # Потоковая запись результатов текущего (или последнего) сканирования
+        self.result_writer: Optional[gtin_export.PageWriter] = None
+        # Параметры libdmtx текущего сканирования и автофиксация
+        self.decode_options: dict = {}
+        self.decoder_lock: Optional[DecoderLock] = None
+        # Бэкенды декодирования текущего сканирования: основной и запасной
+        self.decoder_chain = gtin_decoders.DecoderChain()
+        # Цепочка предобработки текущего документа
+        self.preprocess_chain = PreprocessChain(gtin_preprocess.VARIANTS)
+        self.preprocess_engine = gtin_preprocess.PreprocessEngine()
 
         self.progress_queue: "queue.Queue[str]" = queue.Queue()
         self.current_progress = {
@@ -77,25 +498,47 @@ class GTINScanner:
         if pdf_file is None:
             logger.warning("PDF файл не предоставлен")
             return None, "⚠️ Пожалуйста, загрузите PDF файл"
+        if self.scanning:
+            # Документ, автофиксация и буферы предобработки принадлежат идущему сканированию
+            return gr.update(), "⚠️ Сканирование уже выполняется, новый файл можно загрузить после него"
 
         try:
             self.pdf_path = pdf_file.name
             self.pdf_document = fitz.open(self.pdf_path)
             page = self.pdf_document[0]
+            # Автофиксация декодера и победитель предобработки относятся к предыдущему файлу
+            self.decoder_lock = None
+            self.preprocess_chain = PreprocessChain(self.preprocess_chain.variants)
 
-            mat = fitz.Matrix(2.0, 2.0)
-            pix = page.get_pixmap(matrix=mat)
-            image_data = pix.tobytes("png")
-            self.preview_image = Image.open(io.BytesIO(image_data))
+            self.preview_image = self._render_clip(page, None, self.PREVIEW_ZOOM, "rgb")
 
             total_pages = len(self.pdf_document)
             message = (
                 f"✅ PDF загружен: {Path(self.pdf_path).name}\n"
                 f"📄 Страниц: {total_pages}\n\n"
                 "⚠️ Для больших файлов рекомендуется протестировать на первых 10-50 страницах\n"
-                "🖱️ Дважды кликните по изображению, чтобы выделить область с Data Matrix (клик на левый верхний угол и правый нижний)"
             )
-            return self.preview_image, message
+            proposal = self._propose_roi()
+            if proposal is None:
+                message += "🖱️ Дважды кликните по изображению, чтобы выделить область с Data Matrix (клик на левый верхний угол и правый нижний)"
+                return self.preview_image, message
+
+            self.roi_fractions = proposal
+            clip = self._page_clip(page)
+            zoom = self.PREVIEW_ZOOM
+            self.crop_rect = (
+                int(clip.x0 * zoom),
+                int(clip.y0 * zoom),
+                int(math.ceil(clip.x1 * zoom)),
+                int(math.ceil(clip.y1 * zoom)),
+            )
+            overlay = self.preview_image.copy()
+            ImageDraw.Draw(overlay).rectangle(self.crop_rect, outline=(255, 0, 0), width=3)
+            message += (
+                "🎯 Область с Data Matrix предложена автоматически (красная рамка)\n"
+                "▶️ Можно сразу начинать сканирование или выделить область заново двумя кликами"
+            )
+            return overlay, message
         except Exception as exc:
             logger.error("Ошибка при загрузке PDF: %s", exc, exc_info=True)
             return None, f"❌ Ошибка при загрузке PDF: {exc}"
@@ -120,6 +563,8 @@ class GTINScanner:
         x2 = max(self.selection_start[0], self.selection_end[0])
         y2 = max(self.selection_start[1], self.selection_end[1])
         self.crop_rect = (x1, y1, x2, y2)
+        if self.pdf_document is not None:
+            self.roi_fractions = self._roi_from_preview(self.pdf_document[0], self.crop_rect)
 
         width = x2 - x1
         height = y2 - y1
@@ -133,14 +578,39 @@ class GTINScanner:
             "▶️ Теперь нажмите 'Начать сканирование'"
         )
 
-    def scan_pdf_with_live_progress(self, max_pages=None):
+    def scan_pdf_with_live_progress(
+        self,
+        max_pages=None,
+        render_profile=None,
+        adaptive_zoom=True,
+        max_zoom=None,
+        embedded_images=True,
+        vector_drawings=True,
+        page_scans=True,
+        text_layer=False,
+        text_confirm_pages=None,
+        auto_strategy=True,
+        track_symbol=True,
+        whole_page=False,
+        preprocess_variants=None,
+        mosaic_pages=None,
+        grid_rows=None,
+        grid_cols=None,
+        grid_detect=False,
+        export_format=gtin_export.DEFAULT_FORMAT,
+        export_memory_mb=None,
+        decoder_backend=gtin_decoders.DEFAULT_BACKEND,
+        decoder_fallback=None,
+        decoder_auto_lock=True,
+        *decoder_params,
+    ):
         logger.info("scan_pdf_with_live_progress запущен")
 
         if self.pdf_document is None:
             self.current_progress["status"] = "❌ PDF файл не загружен"
             return "❌ PDF файл не загружен", None, "Загрузите PDF файл", gr.update(value=0)
 
-        if self.crop_rect is None:
+        if self.crop_rect is None and not whole_page:
             self.current_progress["status"] = "❌ Область не выбрана"
             return (
                 "❌ Область не выбрана",
@@ -157,26 +627,233 @@ class GTINScanner:
                 gr.update(value=0),
             )
 
+        if render_profile not in self.RENDER_PROFILES:
+            render_profile = self.DEFAULT_RENDER_PROFILE
+        max_zoom = float(max_zoom) if max_zoom and max_zoom > 0 else self.DEFAULT_MAX_ZOOM
+        logger.info("Профиль рендеринга: %s, потолок масштаба: %.2fx", render_profile, max_zoom)
+        self.decode_options = {
+            name: int(value)
+            for name, value in zip(self.DECODER_PARAMS, decoder_params)
+            if value and value > 0
+        }
+        self.decoder_lock = DecoderLock(self.DECODER_LOCK_PAGES) if decoder_auto_lock else None
+        logger.info("Параметры libdmtx: %s", self.decode_options or "по умолчанию")
+        try:
+            self.decoder_chain = gtin_decoders.DecoderChain(
+                decoder_backend or gtin_decoders.DEFAULT_BACKEND, decoder_fallback or None
+            )
+        except ValueError as e:
+            self.current_progress["status"] = f"❌ {e}"
+            return f"❌ {e}", None, "Выберите установленный декодер", gr.update(value=0)
+        logger.info("Декодер: %s", " → ".join(self.decoder_chain.names))
+        try:
+            writer_class = gtin_export.writer_class(export_format or gtin_export.DEFAULT_FORMAT)
+        except ValueError as e:
+            self.current_progress["status"] = f"❌ {e}"
+            return f"❌ {e}", None, "Выберите доступный формат выгрузки", gr.update(value=0)
+        logger.info("Формат выгрузки: %s", writer_class.name)
+        if preprocess_variants is not None:
+            # Порядок всегда по стоимости, независимо от порядка отметок в интерфейсе
+            variants = [v for v in gtin_preprocess.VARIANTS if v in preprocess_variants]
+        else:
+            variants = self.preprocess_chain.variants
+        self.preprocess_chain = PreprocessChain(variants)
+        logger.info("Цепочка предобработки: %s", ", ".join(self.preprocess_chain.variants))
+
         self.scanning = True
         self.stop_requested = False
 
         def worker():
+            pool = None
+            writer = None
             try:
-                all_codes: list[str] = []
+                found_codes = 0
                 total_pages = len(self.pdf_document)
                 if max_pages and max_pages > 0:
                     total_pages = min(total_pages, int(max_pages))
 
+                use_embedded, use_vector, use_scans, use_text = (
+                    embedded_images,
+                    vector_drawings,
+                    page_scans,
+                    text_layer,
+                )
+                grid = None
+                if not whole_page:
+                    if grid_detect:
+                        grid = self._detect_grid(self.pdf_document[0], render_profile)
+                    elif grid_rows and grid_cols and grid_rows * grid_cols > 1:
+                        grid = (int(grid_rows), int(grid_cols))
+                if grid is not None:
+                    logger.info("Сетка этикеток: %d x %d", *grid)
+                    pool = ThreadPoolExecutor(max_workers=self.GRID_WORKERS)
+                # Коды пишутся в файл после каждой страницы, в памяти не копятся
+                writer = gtin_export.create_writer(
+                    writer_class.name,
+                    gtin_export.GRID_COLUMNS if grid is not None else gtin_export.COLUMNS,
+                    memory_limit_mb=export_memory_mb or None,
+                )
+                self.result_writer = writer
+                # Ячейки сетки текущей страницы: (строка, столбец, код или None, прямоугольник);
+                # из пустых ячеек запоминаются первые несколько для статуса
+                grid_cells: list = []
+                missing_cells: list = []
+                missing_count = 0
+                # Страницы, где код не прошёл разбор GS1 и после повторного декодирования
+                invalid_pages: list[int] = []
+                if whole_page or grid is not None:
+                    # Стратегии без рендеринга и текстовый слой рассчитаны на один символ в области
+                    use_embedded = use_vector = use_scans = use_text = False
+                preflight = None
+                if auto_strategy and not whole_page and grid is None:
+                    self.current_progress.update(
+                        {
+                            "status": "🔎 Предварительный анализ документа...",
+                            "current_page_content": "Пробные страницы...",
+                        }
+                    )
+                    enabled = self._enabled_strategies(use_embedded, use_vector, use_scans, use_text)
+                    preflight = self._cached_preflight(
+                        total_pages, render_profile, max_zoom, enabled
+                    )
+                    # Анализ только сужает набор стратегий, включённых пользователем
+                    chosen = preflight["strategy"]
+                    use_embedded = use_embedded and chosen == "embedded"
+                    use_vector = use_vector and chosen == "vector"
+                    use_scans = use_scans and chosen == "scan"
+                    use_text = use_text and chosen == "text"
+
+                calibrator = None
+                if adaptive_zoom:
+                    calibrator = ZoomCalibrator(
+                        self.SCAN_ZOOM,
+                        self.TARGET_PX_PER_MODULE,
+                        self.MIN_SCAN_ZOOM,
+                        min(self.MAX_SCAN_ZOOM, max_zoom),
+                        samples=self.CALIBRATION_PAGES,
+                    )
+                rung_stats: Counter = Counter()
+                # Результаты декодирования встроенных изображений по xref
+                image_cache: dict[int, list] = {}
+                # Стратегии без растеризации страницы, в порядке стоимости
+                strategies = []
+                if use_embedded:
+                    strategies.append(
+                        ("embedded", lambda page, num: self._decode_embedded(page, image_cache, num))
+                    )
+                if use_vector:
+                    strategies.append(("vector", self._decode_vector))
+                if use_scans:
+                    strategies.append(("scan", self._decode_page_scan))
+                strategy_hits: Counter = Counter()
+                strategy_misses: Counter = Counter()
+                text_shortcut = None
+                if use_text:
+                    text_shortcut = TextLayerShortcut(
+                        max(1, int(text_confirm_pages or self.TEXT_CONFIRM_PAGES)),
+                        self.TEXT_SPOT_CHECK_EVERY,
+                    )
+
+                tracker = SymbolTracker() if track_symbol and not whole_page and grid is None else None
+                mosaic_size = (
+                    0
+                    if whole_page or grid is not None
+                    else min(int(mosaic_pages or 0), self.MAX_MOSAIC_PAGES)
+                )
+                # Результаты мозаики для следующих страниц: {номер: (символы, размер области)}
+                mosaic_results: dict = {}
+                mosaic_done = -1
+
+                def mosaic_ready() -> bool:
+                    """Мозаика выгодна, только когда страницы идут через рендеринг области."""
+                    return (
+                        mosaic_size > 1
+                        and all(
+                            not strategy_hits[name]
+                            and strategy_misses[name] >= self.STRATEGY_PROBE_PAGES
+                            for name, _ in strategies
+                        )
+                        and (calibrator is None or not calibrator.calibrating)
+                        and (text_shortcut is None or not text_shortcut.active)
+                    )
+
+                def run_mosaic(first_page) -> int:
+                    """Декодирует мозаику со следующих страниц; возвращает номер последней."""
+                    zoom = self._build_ladder(max_zoom, calibrator)[0][0]
+                    last = min(first_page + mosaic_size, total_pages) - 1
+                    batch = []
+                    for num in range(first_page, last + 1):
+                        page = self.pdf_document[num]
+                        clip = self._page_clip(page)
+                        if clip is None:
+                            continue
+                        if tracker is not None:
+                            window = tracker.window(page, self._page_roi(page))
+                            if window is not None:
+                                clip = (window * page.rotation_matrix) & page.rect
+                        batch.append((num, page, clip))
+                    if len(batch) > 1:
+                        clips = {num: clip for num, _, clip in batch}
+                        found = self._decode_mosaic(batch, zoom, render_profile)
+                        for num, (decoded_objects, size) in found.items():
+                            mosaic_results[num] = (decoded_objects, size, clips[num], zoom)
+                    return last
+
+                def decode_page(page, clip, page_num):
+                    nonlocal mosaic_done
+                    if whole_page:
+                        return self._decode_whole_page(
+                            page, render_profile, max_zoom, page_num, calibrator
+                        )
+                    if grid is not None:
+                        cells, rung = self._decode_grid(
+                            page, clip, grid, render_profile, max_zoom, page_num, pool
+                        )
+                        for row, col, obj in cells:
+                            # Некорректный код в ячейке учитывается как пустая ячейка
+                            symbols = self._decoded_to_symbols([obj], page_num)[0] if obj else []
+                            grid_cells.append((row, col, *(symbols[0] if symbols else (None, None))))
+                        return [obj for _, _, obj in cells if obj], rung
+                    if page_num > mosaic_done and mosaic_ready():
+                        mosaic_done = run_mosaic(page_num)
+                    if page_num in mosaic_results:
+                        decoded_objects, size, tile_clip, zoom = mosaic_results.pop(page_num)
+                        placed = self._place(page, tile_clip, zoom, size, decoded_objects)
+                        if tracker is not None:
+                            tracker.update(page, self._symbols_page_rect(placed))
+                        if self.decoder_lock is not None:
+                            self.decoder_lock.record(True)
+                        return placed, "mosaic"
+                    for name, strategy in strategies:
+                        if (
+                            not strategy_hits[name]
+                            and strategy_misses[name] >= self.STRATEGY_PROBE_PAGES
+                        ):
+                            continue
+                        decoded_objects = strategy(page, page_num)
+                        if decoded_objects:
+                            strategy_hits[name] += 1
+                            return decoded_objects, name
+                        strategy_misses[name] += 1
+                    return self._decode_with_ladder(
+                        page, clip, render_profile, max_zoom, page_num, calibrator, tracker
+                    )
+
                 start_time = time.time()
                 self.current_progress.update(
                     {
-                        "status": "🔄 Сканирование запущено...",
+                        "status": (
+                            self._format_preflight(preflight) + "\n🔄 Сканирование запущено..."
+                            if preflight
+                            else "🔄 Сканирование запущено..."
+                        ),
                         "current_page": 0,
                         "total_pages": total_pages,
                         "found_codes": 0,
                         "elapsed_time": 0,
                         "current_page_content": "Инициализация...",
                         "csv_file": None,
+                        "rung_stats": rung_stats,
                     }
                 )
 
@@ -187,57 +864,78 @@ class GTINScanner:
 
                     page_start = time.time()
                     page = self.pdf_document[page_num]
-                    mat = fitz.Matrix(3.0, 3.0)
-                    pix = page.get_pixmap(matrix=mat)
-                    image = Image.open(io.BytesIO(pix.tobytes("png")))
-
-                    scale = 3.0 / 2.0
-                    x1 = int(self.crop_rect[0] * scale)
-                    y1 = int(self.crop_rect[1] * scale)
-                    x2 = int(self.crop_rect[2] * scale)
-                    y2 = int(self.crop_rect[3] * scale)
-                    width, height = image.size
-                    x2 = min(x2, width)
-                    y2 = min(y2, height)
-
-                    cropped = image.crop((x1, y1, x2, y2))
-                    cropped = self._optimize_for_datamatrix(cropped)
-
-                    try:
-                        decoded_objects = decode(cropped)
-                    except Exception as decode_error:
-                        logger.error(
-                            "Ошибка декодирования на странице %d: %s",
+                    clip = None if whole_page else self._page_clip(page)
+                    if clip is None and not whole_page:
+                        logger.warning(
+                            "Область не попадает на страницу %d, страница пропущена",
                             page_num + 1,
-                            decode_error,
-                            exc_info=True,
                         )
-                        decoded_objects = []
-
-                    page_codes: list[str] = []
-                    for idx, obj in enumerate(decoded_objects):
-                        raw_bytes = obj.data
-                        logger.debug(
-                            "Raw decoded bytes (page %d, index %d): %s",
-                            page_num + 1,
-                            idx,
-                            raw_bytes,
-                        )
-                        try:
-                            code_data = raw_bytes.decode("utf-8")
-                        except UnicodeDecodeError:
-                            code_data = raw_bytes.decode("latin-1")
-                        clean_code = self._normalize_code(code_data)
-                        if clean_code != code_data:
-                            logger.debug(
-                                "Normalized code differs (page %d, index %d): '%s' -> '%s'",
-                                page_num + 1,
-                                idx,
-                                code_data,
-                                clean_code,
+                        writer.write_page(page_num, [])
+                        continue
+                    text_codes: list[str] = []
+                    if text_shortcut is not None and not text_shortcut.disabled:
+                        text_codes = [
+                            code
+                            for code in gtin_gs1.normalize_batch(
+                                gtin_extract.text_layer_codes(page, self._page_roi(page))
+                            )
+                            if code
+                        ]
+                    if text_codes and text_shortcut.take_text():
+                        # Положение кода в текстовом слое не отслеживается
+                        page_symbols, rung = [(code, None) for code in text_codes], "text"
+                    else:
+                        decoded_objects, rung = decode_page(page, clip, page_num)
+                        page_symbols, invalid = self._decoded_to_symbols(decoded_objects, page_num)
+                        if invalid and not whole_page and grid is None:
+                            recheck = self._recheck_page(
+                                page, clip, render_profile, max_zoom, page_num
+                            )
+                            if recheck is not None:
+                                page_symbols, rung = recheck
+                                invalid = 0
+                        if invalid:
+                            logger.warning(
+                                "Страница %d: некорректных кодов отброшено: %d", page_num + 1, invalid
+                            )
+                            invalid_pages.append(page_num)
+                        if text_codes:
+                            text_shortcut.confirm(
+                                text_codes, [code for code, _ in page_symbols], page_num
                             )
-                        page_codes.append(clean_code)
-                        all_codes.append(clean_code)
+                    page_codes = [code for code, _ in page_symbols]
+                    rung_stats[rung or "нет"] += 1
+                    decode_ms = round((time.time() - page_start) * 1000, 1)
+                    source = rung or ""
+                    if grid is not None:
+                        rows = []
+                        for row, col, code, bbox in grid_cells:
+                            rows.append(
+                                (
+                                    page_num + 1,
+                                    row + 1,
+                                    col + 1,
+                                    code or "",
+                                    *self._bbox_values(bbox),
+                                    decode_ms,
+                                    source,
+                                )
+                            )
+                            if code is None:
+                                missing_count += 1
+                                if len(missing_cells) < self.GRID_MISSING_SHOWN:
+                                    missing_cells.append((page_num, row, col))
+                        grid_cells.clear()
+                        writer.write_page(page_num, rows)
+                    else:
+                        writer.write_page(
+                            page_num,
+                            [
+                                (page_num + 1, code, *self._bbox_values(bbox), decode_ms, source)
+                                for code, bbox in page_symbols
+                            ],
+                        )
+                    found_codes += len(page_codes)
 
                     elapsed = time.time() - start_time
                     status = (
@@ -251,7 +949,7 @@ class GTINScanner:
                         {
                             "status": status,
                             "current_page": page_num + 1,
-                            "found_codes": len(all_codes),
+                            "found_codes": found_codes,
                             "elapsed_time": elapsed,
                             "current_page_content": (
                                 f"Страница {page_num + 1}: {preview}"
@@ -261,49 +959,300 @@ class GTINScanner:
                         }
                     )
                     logger.info(
-                        "Страница %d обработана за %.2fс",
+                        "Страница %d обработана за %.2fс (ступень: %s)",
                         page_num + 1,
                         time.time() - page_start,
+                        rung or "нет",
                     )
 
                 total_time = time.time() - start_time
-                if all_codes:
-                    csv_file = self._generate_csv(all_codes)
+                csv_path = writer.close()
+                if found_codes:
+                    csv_file = csv_path
+                    zoom_note = (
+                        f"🔍 Масштаб рендеринга: {calibrator.current_zoom():.2f}x\n"
+                        if calibrator is not None and calibrator.active
+                        else ""
+                    )
+                    strategy_note = (
+                        f"🧭 Стратегия: {self.STRATEGY_TITLES[preflight['strategy']]}\n"
+                        if preflight
+                        else ""
+                    )
+                    decoder_note = (
+                        "🧩 Изображений распознано декодером: "
+                        + ", ".join(
+                            f"{name}: {self.decoder_chain.hits[name]}"
+                            for name in self.decoder_chain.names
+                        )
+                        + "\n"
+                        if len(self.decoder_chain.names) > 1
+                        else ""
+                    )
+                    invalid_note = (
+                        f"⚠️ Отброшены некорректные коды на страницах: {self._format_pages(invalid_pages)}\n"
+                        if invalid_pages
+                        else ""
+                    )
+                    export_note = f"📦 {writer.note}\n" if writer.note else ""
+                    grid_note = (
+                        f"🔲 Сетка {grid[0]}x{grid[1]}: {self._format_missing_cells(missing_count, missing_cells)}\n"
+                        if grid is not None
+                        else ""
+                    )
                     self.current_progress.update(
                         {
                             "status": (
                                 f"✅ Сканирование завершено за {total_time:.1f}с!\n"
                                 f"📄 Страниц обработано: {total_pages}\n"
-                                f"✅ Найдено кодов: {len(all_codes)}\n"
+                                f"✅ Найдено кодов: {found_codes}\n"
+                                f"{zoom_note}"
+                                f"📶 Ступени: {self._format_rung_stats(rung_stats)}\n"
+                                f"{strategy_note}"
+                                f"{grid_note}"
+                                f"{invalid_note}"
+                                f"{decoder_note}"
+                                f"{export_note}"
                                 "💾 Файл готов к скачиванию"
                             ),
                             "csv_file": csv_file,
                             "current_page_content": (
-                                f"Всего найдено {len(all_codes)} кодов за {total_time:.1f}с"
+                                f"Всего найдено {found_codes} кодов за {total_time:.1f}с"
                             ),
                         }
                     )
                 else:
                     self.current_progress.update(
                         {
-                            "status": "⚠️ Коды не найдены в выделенной области",
-                            "current_page_content": "Проверьте выделенную область",
+                            "status": (
+                                "⚠️ Коды не найдены в выделенной области"
+                                if not invalid_pages
+                                else "⚠️ Все прочитанные коды некорректны (не разбираются как GS1)"
+                            ),
+                            "current_page_content": (
+                                "Проверьте выделенную область"
+                                if not invalid_pages
+                                else f"Страницы: {self._format_pages(invalid_pages)}"
+                            ),
                         }
                     )
             except Exception as exc:
                 logger.error("Критическая ошибка сканирования: %s", exc, exc_info=True)
+                # Всё, что записано до сбоя, остаётся доступным для скачивания
+                saved = writer is not None and writer.rows_written > 0
                 self.current_progress.update(
                     {
-                        "status": f"❌ Ошибка при сканировании: {exc}",
+                        "status": f"❌ Ошибка при сканировании: {exc}"
+                        + ("\n💾 Коды, найденные до ошибки, сохранены в файл" if saved else ""),
                         "current_page_content": "Ошибка",
+                        "csv_file": writer.close() if saved else None,
                     }
                 )
             finally:
+                if pool is not None:
+                    pool.shutdown(wait=False)
+                if writer is not None:
+                    writer.close()
                 self.scanning = False
 
         threading.Thread(target=worker, daemon=True).start()
         return "🔄 Сканирование запущено в фоновом режиме", None, "Сканирование начато..."
 
+    def preflight_document(
+        self,
+        max_pages=None,
+        render_profile=None,
+        max_zoom=None,
+        embedded_images=True,
+        vector_drawings=True,
+        page_scans=True,
+        text_layer=False,
+    ):
+        logger.info("preflight_document запущен")
+
+        if self.pdf_document is None:
+            return "❌ PDF файл не загружен"
+        if self.roi_fractions is None:
+            return "❌ Область не выбрана"
+        if self.scanning:
+            return "⚠️ Сканирование уже выполняется"
+
+        total_pages = len(self.pdf_document)
+        if max_pages and max_pages > 0:
+            total_pages = min(total_pages, int(max_pages))
+        if render_profile not in self.RENDER_PROFILES:
+            render_profile = self.DEFAULT_RENDER_PROFILE
+        max_zoom = float(max_zoom) if max_zoom and max_zoom > 0 else self.DEFAULT_MAX_ZOOM
+        enabled = self._enabled_strategies(embedded_images, vector_drawings, page_scans, text_layer)
+        try:
+            self.preflight_result = self._run_preflight(
+                total_pages, render_profile, max_zoom, enabled
+            )
+        except Exception as exc:
+            logger.error("Ошибка предварительного анализа: %s", exc, exc_info=True)
+            return f"❌ Ошибка предварительного анализа: {exc}"
+        return self._format_preflight(self.preflight_result)
+
+    @staticmethod
+    def _enabled_strategies(embedded_images, vector_drawings, page_scans, text_layer) -> frozenset:
+        """Стратегии без рендеринга, включённые пользователем."""
+        flags = {
+            "embedded": embedded_images,
+            "vector": vector_drawings,
+            "scan": page_scans,
+            "text": text_layer,
+        }
+        return frozenset(name for name, enabled in flags.items() if enabled)
+
+    def _preflight_key(self, total_pages, render_profile, max_zoom, enabled) -> tuple:
+        # Решение зависит и от декодера: при других параметрах оно могло быть другим
+        return (
+            self.pdf_path,
+            self.roi_fractions,
+            total_pages,
+            render_profile,
+            max_zoom,
+            enabled,
+            tuple(self.decoder_chain.names),
+            tuple(sorted(self.decode_options.items())),
+            tuple(self.preprocess_chain.variants),
+        )
+
+    def _cached_preflight(self, total_pages, render_profile, max_zoom, enabled) -> dict:
+        key = self._preflight_key(total_pages, render_profile, max_zoom, enabled)
+        if self.preflight_result is None or self.preflight_result["key"] != key:
+            self.preflight_result = self._run_preflight(
+                total_pages, render_profile, max_zoom, enabled
+            )
+        return self.preflight_result
+
+    @contextmanager
+    def _trial_decoding(self):
+        """Пробные декодирования (предварительный анализ, предложение области).
+
+        На время блока подставляются отдельные автофиксация, копия цепочки
+        предобработки, её буферы и параметры декодера, чтобы пробы не влияли на
+        сканирование. Вызывается, только когда сканирование страниц не идёт.
+        """
+        saved = (
+            self.decoder_lock,
+            self.preprocess_chain,
+            self.preprocess_engine,
+            self.decode_options,
+        )
+        lock, chain, _, options = saved
+        self.decoder_lock = DecoderLock(lock.samples) if lock is not None else None
+        self.preprocess_chain = PreprocessChain(chain.variants)
+        self.preprocess_chain.wins = Counter(chain.wins)
+        self.preprocess_engine = gtin_preprocess.PreprocessEngine()
+        self.decode_options = dict(options)
+        try:
+            yield
+        finally:
+            (
+                self.decoder_lock,
+                self.preprocess_chain,
+                self.preprocess_engine,
+                self.decode_options,
+            ) = saved
+
+    def _run_preflight(self, total_pages, render_profile, max_zoom, enabled) -> dict:
+        """Классифицирует содержимое области на пробных страницах и выбирает стратегию.
+
+        Каждая включённая стратегия (``enabled``), для которой на пробных
+        страницах есть подходящее содержимое, прогоняется по ним с замером
+        времени. Выбирается самая быстрая из тех, чьи коды совпали с эталонным
+        рендерингом на всех страницах; если рендеринг не нашёл кодов ни на одной
+        пробной странице, сверять не с чем, и остаётся рендеринг. Пробные
+        декодирования идут с отдельной автофиксацией и копией цепочки
+        предобработки, чтобы не влиять на настоящее сканирование.
+        """
+        count = min(self.PREFLIGHT_SAMPLES, total_pages)
+        samples = sorted({round(i * (total_pages - 1) / max(count - 1, 1)) for i in range(count)})
+
+        kinds: Counter = Counter()
+        for page_num in samples:
+            page = self.pdf_document[page_num]
+            kinds.update(gtin_extract.classify_region(page, self._page_roi(page)))
+
+        runners = {
+            "render": lambda page, num: self._decoded_to_codes(
+                self._decode_with_ladder(page, self._page_clip(page), render_profile, max_zoom, num)[0],
+                num,
+            )[0],
+            "text": lambda page, num: [
+                code
+                for code in gtin_gs1.normalize_batch(
+                    gtin_extract.text_layer_codes(page, self._page_roi(page))
+                )
+                if code
+            ],
+            "embedded": lambda page, num: self._decoded_to_codes(
+                self._decode_embedded(page, {}, num), num
+            )[0],
+            "vector": lambda page, num: self._decoded_to_codes(self._decode_vector(page, num), num)[0],
+            "scan": lambda page, num: self._decoded_to_codes(self._decode_page_scan(page, num), num)[0],
+        }
+        candidates = ["render"] + [
+            name for name in self.STRATEGY_TITLES if name in enabled and kinds[name]
+        ]
+
+        results = {}
+        with self._trial_decoding():
+            for name in candidates:
+                codes = {}
+                started = time.perf_counter()
+                for page_num in samples:
+                    codes[page_num] = sorted(runners[name](self.pdf_document[page_num], page_num))
+                elapsed = max(time.perf_counter() - started, 1e-6)
+                results[name] = {"codes": codes, "pages_per_sec": len(samples) / elapsed}
+
+        reference = results["render"]["codes"]
+        verified = any(reference.values())
+        strategy = "render"
+        for name in candidates:
+            codes = results[name]["codes"]
+            matches = sum(1 for page_num in samples if codes[page_num] == reference[page_num])
+            results[name]["matches"] = matches
+            correct = verified and matches == len(samples)
+            if correct and results[name]["pages_per_sec"] > results[strategy]["pages_per_sec"]:
+                strategy = name
+
+        logger.info(
+            "Предварительный анализ: содержимое %s, выбрана стратегия %s (%.1f стр/с)",
+            dict(kinds),
+            strategy,
+            results[strategy]["pages_per_sec"],
+        )
+        return {
+            "key": self._preflight_key(total_pages, render_profile, max_zoom, enabled),
+            "samples": len(samples),
+            "kinds": kinds,
+            "results": results,
+            "strategy": strategy,
+        }
+
+    def _format_preflight(self, preflight: dict) -> str:
+        samples = preflight["samples"]
+        kinds = ", ".join(
+            f"{self.STRATEGY_TITLES[name]}: {count}" for name, count in preflight["kinds"].most_common()
+        )
+        lines = [
+            f"🔎 Предварительный анализ ({samples} стр.)",
+            f"Содержимое области: {kinds or 'не распознано, нужен рендеринг'}",
+        ]
+        for name, result in preflight["results"].items():
+            lines.append(
+                f"• {self.STRATEGY_TITLES[name]}: совпадений {result['matches']}/{samples}, "
+                f"{result['pages_per_sec']:.1f} стр/с"
+            )
+        chosen = preflight["strategy"]
+        lines.append(
+            f"✅ Выбрана стратегия: {self.STRATEGY_TITLES[chosen]} "
+            f"({preflight['results'][chosen]['pages_per_sec']:.1f} стр/с)"
+        )
+        return "\n".join(lines)
+
     def get_live_progress(self):
         if self.scanning:
             stats = (
@@ -312,11 +1261,12 @@ class GTINScanner:
                 f"Кодов: {self.current_progress['found_codes']} | "
                 f"Время: {self.current_progress['elapsed_time']:.1f}с"
             )
+            # Файл не трогаем: там может быть промежуточный результат, скачанный кнопкой
             return (
                 self.current_progress["status"],
                 stats,
                 self.current_progress["current_page_content"],
-                self.current_progress["csv_file"],
+                gr.update(),
             )
         return (
             self.current_progress["status"],
@@ -325,78 +1275,734 @@ class GTINScanner:
             self.current_progress["csv_file"],
         )
 
-    def _optimize_for_datamatrix(self, image: Image.Image) -> Image.Image:
+    def _roi_from_preview(self, page, crop_rect) -> Tuple[float, float, float, float]:
+        """Переводит выделение на превью в доли неповёрнутой страницы.
+
+        Превью отрисовано с учётом поворота страницы, поэтому точки сначала
+        возвращаются в неповёрнутую систему координат PDF.
+        """
+        zoom = self.PREVIEW_ZOOM
+        visible = fitz.Rect(
+            crop_rect[0] / zoom,
+            crop_rect[1] / zoom,
+            crop_rect[2] / zoom,
+            crop_rect[3] / zoom,
+        )
+        unrotated = visible * page.derotation_matrix
+        base = page.rect * page.derotation_matrix
+        return (
+            (unrotated.x0 - base.x0) / base.width,
+            (unrotated.y0 - base.y0) / base.height,
+            (unrotated.x1 - base.x0) / base.width,
+            (unrotated.y1 - base.y0) / base.height,
+        )
+
+    def _page_roi(self, page) -> Optional["fitz.Rect"]:
+        """Область сканирования в неповёрнутых координатах конкретной страницы.
+
+        Доли применяются к собственному размеру страницы.
+        """
+        if self.roi_fractions is None:
+            return None
+        fx0, fy0, fx1, fy1 = self.roi_fractions
+        base = page.rect * page.derotation_matrix
+        return fitz.Rect(
+            base.x0 + fx0 * base.width,
+            base.y0 + fy0 * base.height,
+            base.x0 + fx1 * base.width,
+            base.y0 + fy1 * base.height,
+        )
+
+    def _page_clip(self, page) -> Optional["fitz.Rect"]:
+        """Область сканирования для ``clip`` у ``get_pixmap`` в точках PDF.
+
+        Переводит область в повёрнутую систему координат страницы.
+        Возвращает ``None``, если область вне страницы.
+        """
+        roi = self._page_roi(page)
+        if roi is None:
+            return None
+        clip = (roi * page.rotation_matrix) & page.rect
+        if clip.is_empty:
+            return None
+        return clip
+
+    def _pixmap_to_image(self, pix) -> Image.Image:
+        """Строит PIL-изображение прямо из буфера пикселей без PNG-кодирования."""
+        if pix.alpha:
+            mode = "RGBA" if pix.n == 4 else "LA"
+        else:
+            mode = "L" if pix.n == 1 else "RGB"
+        return Image.frombytes(mode, (pix.width, pix.height), pix.samples_mv)
+
+    def _render_clip(self, page, clip, zoom: float, profile: str) -> Image.Image:
+        settings = self.RENDER_PROFILES[profile]
+        # Уровень сглаживания в MuPDF глобальный, поэтому выставляется перед каждым рендером
+        fitz.TOOLS.set_aa_level(settings["aa_level"])
+        mat = fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(
+            matrix=mat,
+            clip=clip,
+            colorspace=settings["colorspace"],
+            alpha=settings["alpha"],
+            annots=settings["annots"],
+        )
+        try:
+            return self._pixmap_to_image(pix)
+        finally:
+            # Буфер пиксмапа уже скопирован в изображение, освобождаем сразу
+            del pix
+
+    def _decode_embedded(self, page, image_cache: dict, page_num: int) -> list:
+        """Декодирует встроенное изображение Data Matrix в исходном разрешении.
+
+        Результат кэшируется по xref, поэтому изображение, общее для нескольких
+        страниц, декодируется один раз. Положение символа — прямоугольник
+        изображения на странице.
+        """
+        info = gtin_extract.find_roi_image(page, self._page_roi(page))
+        if info is None:
+            return []
+        xref = info["xref"]
+        if xref not in image_cache:
+            image = gtin_extract.load_symbol_image(self.pdf_document, info)
+            if image is None:
+                image_cache[xref] = []
+            else:
+                try:
+                    image_cache[xref] = self._decode_image(image, page_num)
+                finally:
+                    image.close()
+            logger.debug(
+                "Встроенное изображение xref=%d на странице %d: найдено %d",
+                xref,
+                page_num + 1,
+                len(image_cache[xref]),
+            )
+        return self._place_in(image_cache[xref], fitz.Rect(info["bbox"]))
+
+    def _decode_vector(self, page, page_num: int) -> list:
+        """Декодирует символ, нарисованный векторными прямоугольниками, без рендеринга."""
+        image = gtin_extract.vector_symbol_bitmap(page, self._page_roi(page))
+        if image is None:
+            return []
+        try:
+            return self._place_in(
+                self._decode_image(image, page_num), fitz.Rect(image.info["page_rect"])
+            )
+        finally:
+            image.close()
+
+    def _decode_page_scan(self, page, page_num: int) -> list:
+        """Декодирует область прямо из растра отсканированной страницы.
+
+        Положение символа — вырезанная из скана часть области.
+        """
+        roi = self._page_roi(page)
+        info = gtin_extract.find_page_scan(page, roi)
+        if info is None:
+            return []
+        image = gtin_extract.scan_region_image(self.pdf_document, info, roi, self.SCAN_ZOOM)
+        if image is None:
+            return []
+        try:
+            return self._place_in(
+                self._decode_variants(image, page_num)[0], roi & fitz.Rect(info["bbox"])
+            )
+        finally:
+            image.close()
+
+    def _build_ladder(self, max_zoom: float, calibrator=None) -> list:
+        rungs = [rung for rung in self.ESCALATION_LADDER if rung[0] <= max_zoom]
+        if calibrator is not None and calibrator.active:
+            zoom = calibrator.current_zoom()
+            rungs = [(zoom, 1)] + [rung for rung in rungs if rung[0] > zoom]
+        return rungs or [(max_zoom, None)]
+
+    def _decode_with_ladder(
+        self, page, clip, profile, max_zoom, page_num, calibrator=None, tracker=None
+    ):
+        """Декодирует область, поднимаясь по лестнице эскалации до первого успеха.
+
+        С ``tracker`` первая ступень сначала пробуется в узком окне вокруг
+        символа с предыдущей страницы и только при промахе — во всей области.
+        Возвращает найденные символы (``PlacedSymbol``) и подпись сработавшей
+        ступени (или ``None``).
+        """
+        ladder = self._build_ladder(max_zoom, calibrator)
+        if tracker is not None:
+            window = tracker.window(page, self._page_roi(page))
+            if window is not None:
+                window_clip = (window * page.rotation_matrix) & page.rect
+                zoom, depth = ladder[0]
+                decoded_objects, size, variant = self._scan_clip(
+                    page, window_clip, zoom, profile, depth, page_num, calibrator
+                )
+                if decoded_objects:
+                    if calibrator is not None:
+                        calibrator.record(True)
+                    if self.decoder_lock is not None:
+                        self.decoder_lock.record(True)
+                    placed = self._place(page, window_clip, zoom, size, decoded_objects)
+                    tracker.update(page, self._symbols_page_rect(placed))
+                    return placed, f"{zoom:.2f}x/{variant}/track"
+
+        for index, (zoom, depth) in enumerate(ladder):
+            decoded_objects, size, variant = self._scan_clip(
+                page, clip, zoom, profile, depth, page_num, calibrator
+            )
+            if index == 0 and calibrator is not None:
+                calibrator.record(bool(decoded_objects))
+            if decoded_objects:
+                if self.decoder_lock is not None:
+                    self.decoder_lock.record(True)
+                placed = self._place(page, clip, zoom, size, decoded_objects)
+                if tracker is not None:
+                    tracker.update(page, self._symbols_page_rect(placed))
+                return placed, f"{zoom:.2f}x/{variant}"
+        if self.decoder_lock is not None:
+            self.decoder_lock.record(False)
+        return [], None
+
+    def _decode_whole_page(self, page, profile, max_zoom, page_num, calibrator=None):
+        """Ищет символы по всей странице без выделенной области.
+
+        Страница рендерится целиком в низком разрешении, локатор находит
+        кандидатов, и в рабочем масштабе рендерится только область каждого из них.
+        """
+        decoded_all: list = []
+        seen: set = set()
+        first_rung = None
+        for candidate in self._locate_candidates(page, profile):
+            margin = max(candidate.width, candidate.height) * self.LOCATOR_MARGIN
+            clip = (candidate + (-margin, -margin, margin, margin)) & page.rect
+            if clip.is_empty:
+                continue
+            decoded_objects, rung = self._decode_with_ladder(
+                page, clip, profile, max_zoom, page_num, calibrator
+            )
+            for obj in decoded_objects:
+                if obj.data not in seen:
+                    seen.add(obj.data)
+                    decoded_all.append(obj)
+            first_rung = first_rung or rung
+        return decoded_all, f"locator/{first_rung}" if first_rung else None
+
+    def _locate_candidates(self, page, profile) -> list:
+        """Кандидаты Data Matrix на странице в повёрнутых координатах (для ``clip``)."""
+        zoom = self.LOCATOR_ZOOM
+        image = self._render_clip(page, None, zoom, profile)
+        try:
+            gray = np.asarray(image if image.mode == "L" else image.convert("L"))
+        finally:
+            image.close()
+        candidates = [fitz.Rect(box) / zoom for box in gtin_locator.locate_symbols(gray)]
+        logger.debug("Страница %d: кандидатов Data Matrix %d", page.number + 1, len(candidates))
+        return candidates
+
+    def _propose_roi(self) -> Optional[Tuple[float, float, float, float]]:
+        """Предлагает область сканирования по символам на первых страницах.
+
+        Кандидаты локатора подтверждаются декодированием на первой ступени
+        лестницы (без эскалации); область охватывает все распознанные символы с
+        запасом на сдвиг печати. После ``ROI_PROPOSAL_SECONDS`` просмотр
+        прекращается, и область строится по уже найденным символам; остаток
+        бюджета передаётся декодеру как ``timeout``. Возвращает доли
+        неповёрнутой страницы (как ``roi_fractions``) или ``None`` — тогда
+        область выделяется вручную.
+        """
+        with self._trial_decoding():
+            return self._propose_roi_pages()
+
+    def _propose_roi_pages(self) -> Optional[Tuple[float, float, float, float]]:
+        profile = self.DEFAULT_RENDER_PROFILE
+        zoom, depth = self._build_ladder(self.DEFAULT_MAX_ZOOM)[0]
+        deadline = time.perf_counter() + self.ROI_PROPOSAL_SECONDS
+        options = self.decode_options
+        fractions = []
+        for page_num in range(min(self.ROI_PROPOSAL_PAGES, len(self.pdf_document))):
+            page = self.pdf_document[page_num]
+            base = page.rect * page.derotation_matrix
+            for candidate in self._locate_candidates(page, profile):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                margin = max(candidate.width, candidate.height) * self.LOCATOR_MARGIN
+                clip = (candidate + (-margin, -margin, margin, margin)) & page.rect
+                if clip.is_empty:
+                    continue
+                self.decode_options = dict(options, timeout=max(1, int(remaining * 1000)))
+                decoded_objects, _, _ = self._scan_clip(page, clip, zoom, profile, depth, page_num)
+                if not decoded_objects:
+                    continue
+                margin = max(candidate.width, candidate.height) * self.ROI_PROPOSAL_MARGIN
+                area = (candidate + (-margin, -margin, margin, margin)) * page.derotation_matrix
+                area &= base
+                fractions.append(
+                    (
+                        (area.x0 - base.x0) / base.width,
+                        (area.y0 - base.y0) / base.height,
+                        (area.x1 - base.x0) / base.width,
+                        (area.y1 - base.y0) / base.height,
+                    )
+                )
+            if time.perf_counter() > deadline:
+                logger.info(
+                    "Предложение области: бюджет %.1fс исчерпан на странице %d",
+                    self.ROI_PROPOSAL_SECONDS,
+                    page_num + 1,
+                )
+                break
+        if not fractions:
+            logger.info("Автоматически предложить область не удалось")
+            return None
+        proposal = (
+            min(f[0] for f in fractions),
+            min(f[1] for f in fractions),
+            max(f[2] for f in fractions),
+            max(f[3] for f in fractions),
+        )
+        logger.info("Предложена область (доли страницы): %s", ", ".join(f"{v:.3f}" for v in proposal))
+        return proposal
+
+    def _format_rung_stats(self, rung_stats: Counter) -> str:
+        return ", ".join(f"{rung}: {count}" for rung, count in rung_stats.most_common())
+
+    def _scan_clip(self, page, clip, zoom, profile, depth, page_num, calibrator=None):
+        """Рендерит область и декодирует её первыми ``depth`` вариантами предобработки.
+
+        Возвращает символы, размер изображения и сработавший вариант (или ``None``).
+        """
+        image = self._render_clip(page, clip, zoom, profile)
+        try:
+            if self.RENDER_PROFILES[profile]["sharpen"]:
+                image = self._optimize_for_datamatrix(image)
+            decoded_objects, variant, pitch_px = self._decode_variants(
+                image,
+                page_num,
+                zoom,
+                depth,
+                measure_pitch=calibrator is not None and calibrator.calibrating,
+            )
+            if pitch_px:
+                calibrator.add_sample(pitch_px / zoom)
+            return decoded_objects, image.size, variant
+        finally:
+            image.close()
+
+    def _decode_variants(self, image, page_num, zoom=None, depth=None, measure_pitch=False, tiles=1):
+        """Пробует варианты цепочки предобработки до первого успешного декодирования.
+
+        Возвращает символы, сработавший вариант и шаг модуля в пикселях
+        (только при ``measure_pitch``).
+        """
+        gray = gtin_preprocess.as_gray_array(image)
+        for variant in self.preprocess_chain.order(depth):
+            prepared = gtin_preprocess.apply(variant, gray, self.preprocess_engine)
+            decoded_objects = self._decode_image(prepared, page_num, zoom, tiles)
+            if decoded_objects:
+                self.preprocess_chain.record(variant)
+                pitch_px = (
+                    self._module_pitch(prepared, decoded_objects[0].rect) if measure_pitch else None
+                )
+                return decoded_objects, variant, pitch_px
+        return [], None, None
+
+    def _decode_mosaic(self, batch, zoom, profile) -> dict:
+        """Декодирует области нескольких страниц одним вызовом libdmtx.
+
+        ``batch`` — список ``(номер страницы, страница, clip)``. Области
+        рендерятся в одном масштабе и складываются в сетку с белыми промежутками
+        (тихая зона). Символ относится к странице, в чью клетку попадает его
+        центр, и его ``rect`` пересчитывается в систему координат её области.
+        Возвращает ``{номер страницы: (символы, размер области)}`` только для
+        страниц, где символы найдены.
+        """
+        tiles = []
+        for page_num, page, clip in batch:
+            image = self._render_clip(page, clip, zoom, profile)
+            if self.RENDER_PROFILES[profile]["sharpen"]:
+                image = self._optimize_for_datamatrix(image)
+            tiles.append((page_num, image if image.mode == "L" else image.convert("L")))
+
+        cell_w = max(image.width for _, image in tiles)
+        cell_h = max(image.height for _, image in tiles)
+        gutter = max(self.MOSAIC_MIN_GUTTER, int(max(cell_w, cell_h) * self.MOSAIC_GUTTER))
+        columns = math.ceil(math.sqrt(len(tiles)))
+        rows = math.ceil(len(tiles) / columns)
+        mosaic = Image.new(
+            "L", (columns * (cell_w + gutter) + gutter, rows * (cell_h + gutter) + gutter), 255
+        )
+        placed = []
+        for index, (page_num, image) in enumerate(tiles):
+            ox = gutter + (index % columns) * (cell_w + gutter)
+            oy = gutter + (index // columns) * (cell_h + gutter)
+            mosaic.paste(image, (ox, oy))
+            placed.append((page_num, ox, oy, image.size))
+            image.close()
+
+        try:
+            decoded_objects, _, _ = self._decode_variants(
+                mosaic, batch[0][0], zoom, depth=1, tiles=len(tiles)
+            )
+        finally:
+            height = mosaic.height
+            mosaic.close()
+
+        results: dict = {}
+        for obj in decoded_objects:
+            x0, y0, x1, y1 = self._symbol_bbox(obj.rect, height)
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            for page_num, ox, oy, (width, tile_h) in placed:
+                if ox <= cx < ox + width and oy <= cy < oy + tile_h:
+                    # rect.top в pylibdmtx отсчитывается от нижнего края изображения
+                    local = obj.rect._replace(
+                        left=obj.rect.left - ox,
+                        top=obj.rect.top - (height - (oy + tile_h)),
+                    )
+                    results.setdefault(page_num, ([], (width, tile_h)))[0].append(
+                        obj._replace(rect=local)
+                    )
+                    break
+        logger.debug(
+            "Мозаика из %d страниц: символы найдены на %d", len(placed), len(results)
+        )
+        return results
+
+    def _detect_grid(self, page, profile) -> Optional[Tuple[int, int]]:
+        """Определяет сетку этикеток в выделенной области по символам первой страницы."""
+        clip = self._page_clip(page)
+        if clip is None:
+            return None
+        image = self._render_clip(page, clip, self.LOCATOR_ZOOM, profile)
+        try:
+            gray = gtin_preprocess.as_gray_array(image)
+        finally:
+            image.close()
+        grid = gtin_locator.detect_grid(
+            gtin_locator.locate_symbols(gray, max_candidates=self.GRID_MAX_CANDIDATES)
+        )
+        if grid is None:
+            logger.warning("Сетку этикеток определить не удалось, область декодируется целиком")
+        return grid
+
+    def _decode_grid(self, page, clip, grid, profile, max_zoom, page_num, pool):
+        """Декодирует область, разбитую на сетку, по ячейкам параллельно.
+
+        Область рендерится целиком в главном потоке (MuPDF не потокобезопасен),
+        ячейки — виды на общий массив — декодируются в пуле с ``max_count=1``.
+        Ячейки без кода переходят на следующую ступень лестницы.
+        Возвращает ``[(строка, столбец, символ или None)]`` в порядке чтения
+        и подпись первой сработавшей ступени.
+        """
+        rows, cols = grid
+        found: dict = {}
+        pending = [(row, col) for row in range(rows) for col in range(cols)]
+        first_rung = None
+        for zoom, depth in self._build_ladder(max_zoom):
+            image = self._render_clip(page, clip, zoom, profile)
+            try:
+                if self.RENDER_PROFILES[profile]["sharpen"]:
+                    image = self._optimize_for_datamatrix(image)
+                gray = gtin_preprocess.as_gray_array(image)
+            finally:
+                image.close()
+            ys = np.linspace(0, gray.shape[0], rows + 1).round().astype(int)
+            xs = np.linspace(0, gray.shape[1], cols + 1).round().astype(int)
+            # Порядок вариантов — снимок на ступень: главный поток меняет счётчик
+            # побед, пока ячейки декодируются в пуле
+            order = self.preprocess_chain.order(depth)
+            futures = {
+                (row, col): pool.submit(
+                    self._decode_cell,
+                    gray[ys[row] : ys[row + 1], xs[col] : xs[col + 1]],
+                    page_num,
+                    zoom,
+                    order,
+                )
+                for row, col in pending
+            }
+            for (row, col), future in futures.items():
+                decoded_objects, variant = future.result()
+                if decoded_objects:
+                    cell_clip = fitz.Rect(
+                        clip.x0 + xs[col] / zoom,
+                        clip.y0 + ys[row] / zoom,
+                        clip.x0 + xs[col + 1] / zoom,
+                        clip.y0 + ys[row + 1] / zoom,
+                    )
+                    cell_size = (xs[col + 1] - xs[col], ys[row + 1] - ys[row])
+                    found[(row, col)] = self._place(
+                        page, cell_clip, zoom, cell_size, decoded_objects[:1]
+                    )[0]
+                    self.preprocess_chain.record(variant)
+                    first_rung = first_rung or f"grid/{zoom:.2f}x/{variant}"
+            pending = [cell for cell in pending if cell not in found]
+            if not pending:
+                break
+        if self.decoder_lock is not None:
+            self.decoder_lock.record(not pending)
+        if pending:
+            logger.warning(
+                "Страница %d: пустые ячейки сетки %s",
+                page_num + 1,
+                ", ".join(f"{row + 1}:{col + 1}" for row, col in pending),
+            )
+        return [(row, col, found.get((row, col))) for row in range(rows) for col in range(cols)], first_rung
+
+    def _decode_cell(self, gray, page_num, zoom, order):
+        """Декодирует одну ячейку сетки вариантами ``order`` (выполняется в пуле потоков).
+
+        Общий движок предобработки здесь не используется: его буферы
+        не потокобезопасны. Победивший вариант записывает вызывающий поток.
+        """
+        for variant in order:
+            prepared = gtin_preprocess.apply(variant, gray)
+            decoded_objects = self._decode_image(prepared, page_num, zoom, max_count=1)
+            if decoded_objects:
+                return decoded_objects, variant
+        return [], None
+
+    def _format_missing_cells(self, missing_count: int, missing_cells: list) -> str:
+        if not missing_count:
+            return "все ячейки распознаны"
+        shown = ", ".join(f"стр. {page + 1} ({row + 1}:{col + 1})" for page, row, col in missing_cells)
+        more = f" и ещё {missing_count - len(missing_cells)}" if missing_count > len(missing_cells) else ""
+        return f"пустых ячеек {missing_count}: {shown}{more}"
+
+    def _place(self, page, clip, zoom, size, decoded_objects) -> list:
+        """Символы с прямоугольниками в неповёрнутых координатах страницы.
+
+        ``clip`` — отрендеренная область страницы, ``size`` — размер её изображения.
+        """
+        placed = []
+        for obj in decoded_objects:
+            x0, y0, x1, y1 = self._symbol_bbox(obj.rect, size[1])
+            visible = fitz.Rect(
+                clip.x0 + x0 / zoom,
+                clip.y0 + y0 / zoom,
+                clip.x0 + x1 / zoom,
+                clip.y0 + y1 / zoom,
+            )
+            placed.append(PlacedSymbol(obj.data, obj.rect, visible * page.derotation_matrix))
+        return placed
+
+    @staticmethod
+    def _place_in(decoded_objects, rect) -> list:
+        """Символы из источника без рендеринга: положение — прямоугольник источника."""
+        return [PlacedSymbol(obj.data, obj.rect, rect) for obj in decoded_objects]
+
+    @staticmethod
+    def _symbols_page_rect(placed) -> "fitz.Rect":
+        """Объединённый прямоугольник символов в неповёрнутых координатах страницы."""
+        area = fitz.Rect()
+        for symbol in placed:
+            area |= symbol.bbox
+        return area
+
+    @staticmethod
+    def _bbox_values(bbox) -> tuple:
+        """``x0, y0, x1, y1`` в точках PDF для выгрузки (пусто, если положение неизвестно)."""
+        if bbox is None:
+            return (None, None, None, None)
+        return tuple(round(value, 2) for value in bbox)
+
+    def _symbol_bbox(self, rect, image_height: int) -> Tuple[int, int, int, int]:
+        """Прямоугольник символа в координатах изображения (ось Y вниз).
+
+        pylibdmtx отсчитывает ``rect.top`` от нижнего края изображения.
+        """
+        x0 = min(rect.left, rect.left + rect.width)
+        x1 = max(rect.left, rect.left + rect.width)
+        bottom = min(rect.top, rect.top + rect.height)
+        top = max(rect.top, rect.top + rect.height)
+        return int(x0), int(image_height - top), int(x1), int(image_height - bottom)
+
+    def _module_pitch(self, image, rect) -> Optional[float]:
+        """Оценивает шаг модуля (в пикселях) по длинам серий внутри символа.
+
+        В данных Data Matrix серии длиной в один модуль встречаются чаще всего,
+        поэтому мода длин серий даёт шаг модуля. ``image`` — изображение PIL
+        или массив в оттенках серого.
+        """
+        pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("L"))
+        height, width = pixels.shape[:2]
+        x0, y0, x1, y1 = self._symbol_bbox(rect, height)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width), min(y1, height)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        region = pixels[y0:y1, x0:x1]
+        dark = region < (int(region.min()) + int(region.max())) // 2
+
+        lengths = []
+        for grid in (dark, dark.T):
+            rows, cols = np.nonzero(np.diff(grid.astype(np.int8), axis=1))
+            same_row = np.diff(rows) == 0
+            lengths.append(np.diff(cols)[same_row])
+        lengths = np.concatenate(lengths)
+        if lengths.size < 16:
+            return None
+        mode = int(np.argmax(np.bincount(lengths)))
+        if mode < 1:
+            return None
+        near = lengths[(lengths >= mode * 0.5) & (lengths <= mode * 1.5)]
+        return float(near.mean())
+
+    def _decoded_to_symbols(self, decoded_objects, page_num: int) -> Tuple[list, int]:
+        """Разбирает данные символов как коды маркировки GS1.
+
+        Возвращает пары ``(канонический код, прямоугольник на странице)`` и число
+        символов, данные которых не разобрались (ошибка декодирования: код
+        в результат не попадает).
+        """
+        raw = [obj.data for obj in decoded_objects]
+        symbols = []
+        for idx, (obj, code) in enumerate(zip(decoded_objects, gtin_gs1.normalize_batch(raw))):
+            if code is None:
+                logger.debug(
+                    "Страница %d, символ %d: данные не разбираются как код маркировки: %r",
+                    page_num + 1,
+                    idx,
+                    obj.data,
+                )
+                continue
+            symbols.append((code, obj.bbox))
+        return symbols, len(raw) - len(symbols)
+
+    def _decoded_to_codes(self, decoded_objects, page_num: int) -> Tuple[list, int]:
+        """Канонические коды без положения и число некорректных символов."""
+        symbols, invalid = self._decoded_to_symbols(decoded_objects, page_num)
+        return [code for code, _ in symbols], invalid
+
+    def _recheck_page(self, page, clip, profile, max_zoom, page_num):
+        """Повторно декодирует страницу, где прочитан некорректный код.
+
+        Ступени лестницы пробуются от самой сильной (наибольший масштаб, все
+        варианты предобработки) к слабым, пока все прочитанные коды не
+        пройдут разбор GS1. Возвращает ``(пары код/прямоугольник, подпись ступени)``
+        или ``None``.
+        """
+        for zoom, depth in reversed(self._build_ladder(max_zoom)):
+            decoded_objects, size, variant = self._scan_clip(
+                page, clip, zoom, profile, depth, page_num
+            )
+            if not decoded_objects:
+                continue
+            page_symbols, invalid = self._decoded_to_symbols(
+                self._place(page, clip, zoom, size, decoded_objects), page_num
+            )
+            if not invalid:
+                logger.info("Страница %d: код перечитан на ступени %.2fx/%s", page_num + 1, zoom, variant)
+                return page_symbols, f"recheck/{zoom:.2f}x/{variant}"
+        return None
+
+    @staticmethod
+    def _format_pages(pages: list, limit: int = 10) -> str:
+        shown = ", ".join(str(page + 1) for page in pages[:limit])
+        return shown + (f" и ещё {len(pages) - limit}" if len(pages) > limit else "")
+
+    def _decode_image(
+        self,
+        image,
+        page_num: int,
+        zoom: Optional[float] = None,
+        tiles: int = 1,
+        max_count: Optional[int] = None,
+    ) -> list:
+        """Декодирует изображение цепочкой бэкендов с параметрами текущего сканирования.
+
+        ``image`` — изображение PIL или массив ``uint8`` в оттенках серого
+        (libdmtx получает массив без копирования). ``zoom`` — пикселей на точку PDF;
+        нужен, чтобы пересчитать зафиксированную длину стороны символа в пиксели.
+        ``tiles`` — число областей страниц в мозаике: на него умножаются
+        ``max_count`` и заданный вручную ``timeout`` (зафиксированный пересчитывается
+        по площади), а автофиксация не собирает наблюдения.
+        ``max_count`` задаёт лимит символов явно (ячейка сетки, декодируется
+        в пуле потоков — наблюдения для автофиксации не собираются).
+        """
+        if not isinstance(image, np.ndarray) and image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("L")
+        lock = self.decoder_lock
+        kwargs = lock.decode_kwargs(zoom, self._image_area(image)) if lock is not None else {}
+        kwargs.update(self.decode_options)
+        if tiles > 1:
+            kwargs["max_count"] = kwargs.get("max_count", 1) * tiles
+            # Зафиксированное время уже пересчитано на площадь мозаики;
+            # умножается только время, заданное вручную
+            if "timeout" in self.decode_options:
+                kwargs["timeout"] *= tiles
+        if max_count is not None:
+            kwargs["max_count"] = max_count
+        try:
+            started = time.perf_counter()
+            decoded_objects = self.decoder_chain.decode(image, **kwargs)
+            if (
+                decoded_objects
+                and lock is not None
+                and lock.collecting
+                and tiles == 1
+                and max_count is None
+            ):
+                self._observe_symbols(lock, image, decoded_objects, zoom, time.perf_counter() - started)
+            return decoded_objects
+        except Exception as decode_error:
+            logger.error(
+                "Ошибка декодирования на странице %d: %s",
+                page_num + 1,
+                decode_error,
+                exc_info=True,
+            )
+            return []
+
+    def _observe_symbols(self, lock: DecoderLock, image, decoded_objects, zoom, seconds) -> None:
+        rect = decoded_objects[0].rect
+        edge_px = max(abs(rect.width), abs(rect.height))
+        modules = None
+        pitch_px = self._module_pitch(image, rect)
+        if pitch_px and abs(abs(rect.width) - abs(rect.height)) <= 0.1 * edge_px:
+            estimate = edge_px / pitch_px
+            nearest = min(SQUARE_SYMBOL_SIZES, key=lambda size: abs(size - estimate))
+            if abs(nearest - estimate) <= 1.0:
+                modules = nearest
+        lock.observe(
+            modules,
+            edge_px / zoom if zoom else None,
+            len(decoded_objects),
+            seconds,
+            self._image_area(image),
+        )
+
+    @staticmethod
+    def _image_area(image) -> int:
+        if isinstance(image, np.ndarray):
+            return image.shape[0] * image.shape[1]
+        return image.width * image.height
+
+    def _optimize_for_datamatrix(self, image: Image.Image, sharpen: bool = True) -> Image.Image:
         try:
             if image.mode != "L":
                 image = image.convert("L")
             image = ImageEnhance.Contrast(image).enhance(2.0)
-            image = ImageEnhance.Sharpness(image).enhance(2.0)
+            if sharpen:
+                image = ImageEnhance.Sharpness(image).enhance(2.0)
             return image
         except Exception as exc:
             logger.warning("Ошибка при оптимизации изображения: %s", exc)
             return image
 
-    def _normalize_code(self, raw: str) -> str:
-        s = raw.replace("\n", "").replace("\r", "")
-        translation = str.maketrans(
-            {
-                "\u201c": '"',
-                "\u201d": '"',
-                "\u201e": '"',
-                "\u201f": '"',
-                "\u2018": "'",
-                "\u2019": "'",
-                "\u201a": "'",
-                "\u201b": "'",
-            }
-        )
-        s = s.translate(translation)
-
-        def _replace(match: re.Match[str]) -> str:
-            token = match.group(1)
-            mapping = {
-                '"': '"',
-                "'": "'",
-                "\\": "\\",
-                "/": "/",
-                "n": "",
-                "r": "",
-                "t": " ",
-                "b": "",
-                "f": "",
-            }
-            if token in mapping:
-                return mapping[token]
-            if token.startswith("x"):
-                return chr(int(token[1:], 16))
-            if token.startswith(("u", "U")):
-                return chr(int(token[1:], 16))
-            return match.group(0)
-
-        s = self.ESCAPE_RE.sub(_replace, s)
-        if "\x1d" not in s:
-            marker_index = s.find("93")
-            if marker_index != -1:
-                s = f"{s[:marker_index]}\x1d{s[marker_index:]}"
-                logger.debug("Inserted GS separator before crypto tail: %s", s)
-        s = "".join(ch for ch in s if ord(ch) >= 32 or ch == "\x1d")
-        return s
-
-    def _generate_csv(self, codes: list[str]) -> str:
-        import tempfile
-
-        temp_file = tempfile.NamedTemporaryFile(
-            mode="w",
-            newline="",
-            suffix=".csv",
-            delete=False,
-            encoding="utf-8",
-        )
-        for code in codes:
-            clean_code = self._normalize_code(code)
-            temp_file.write(clean_code + "\n")
-        temp_file.close()
-        return temp_file.name
+    def download_partial(self):
+        """Копия результатов, записанных к текущему моменту (во время сканирования)."""
+        writer = self.result_writer
+        if writer is None:
+            return None
+        if not self.scanning:
+            return self.current_progress["csv_file"]
+        path = writer.snapshot()
+        if path is None:
+            gr.Warning(f"Формат {writer.name}: промежуточный файл доступен только после завершения")
+            return gr.update()
+        return path
 
     def stop_scan(self):
         self.stop_requested = True
@@ -431,25 +2037,175 @@ with gr.Blocks(title="GTIN Scanner Live") as app:
             max_pages_input = gr.Number(
                 label="Максимум страниц (0 = все)", value=50, minimum=0, maximum=10000, step=1
             )
+            render_profile_input = gr.Dropdown(
+                label="Профиль рендеринга",
+                choices=[(cfg["title"], name) for name, cfg in GTINScanner.RENDER_PROFILES.items()],
+                value=GTINScanner.DEFAULT_RENDER_PROFILE,
+            )
+            adaptive_zoom_input = gr.Checkbox(
+                label="Адаптивный масштаб по размеру модуля", value=True
+            )
+            embedded_images_input = gr.Checkbox(
+                label="Встроенные изображения Data Matrix без рендеринга", value=True
+            )
+            vector_drawings_input = gr.Checkbox(
+                label="Векторные Data Matrix без рендеринга", value=True
+            )
+            page_scans_input = gr.Checkbox(
+                label="Сканы: область из исходного изображения страницы", value=True
+            )
+            auto_strategy_input = gr.Checkbox(
+                label="Автовыбор стратегии по пробным страницам", value=True
+            )
+            preflight_btn = gr.Button("🔎 Анализ документа")
+            preflight_display = gr.Textbox(label="Предварительный анализ", value="", lines=6)
+            text_layer_input = gr.Checkbox(
+                label="Брать коды из текстового слоя (после сверки)", value=False
+            )
+            text_confirm_input = gr.Number(
+                label="Страниц для сверки текста с Data Matrix",
+                value=GTINScanner.TEXT_CONFIRM_PAGES,
+                minimum=1,
+                step=1,
+            )
+            track_symbol_input = gr.Checkbox(
+                label="Отслеживать положение символа между страницами", value=True
+            )
+            whole_page_input = gr.Checkbox(
+                label="Искать коды по всей странице (без выделения области)", value=False
+            )
+            mosaic_pages_input = gr.Number(
+                label="Пакетное декодирование: страниц в мозаике (0 = выкл.)",
+                value=GTINScanner.DEFAULT_MOSAIC_PAGES,
+                minimum=0,
+                maximum=GTINScanner.MAX_MOSAIC_PAGES,
+                step=1,
+            )
+            with gr.Accordion("Лист с несколькими этикетками (сетка)", open=False):
+                grid_rows_input = gr.Number(label="Строк (0 = без сетки)", value=0, minimum=0, step=1)
+                grid_cols_input = gr.Number(label="Столбцов (0 = без сетки)", value=0, minimum=0, step=1)
+                grid_detect_input = gr.Checkbox(
+                    label="Определить сетку автоматически по первой странице", value=False
+                )
+            preprocess_variants_input = gr.CheckboxGroup(
+                label="Предобработка (от дешёвой к дорогой, пробуется до первого успеха)",
+                choices=[
+                    (gtin_preprocess.VARIANT_TITLES[name], name) for name in gtin_preprocess.VARIANTS
+                ],
+                value=list(gtin_preprocess.VARIANTS),
+            )
+            with gr.Accordion("Декодер", open=False):
+                decoder_backend_input = gr.Dropdown(
+                    label="Основной декодер",
+                    choices=[
+                        (gtin_decoders.BACKENDS[name].title, name)
+                        for name in gtin_decoders.available_backends()
+                    ],
+                    value=gtin_decoders.DEFAULT_BACKEND,
+                )
+                decoder_fallback_input = gr.Dropdown(
+                    label="Запасной декодер (если основной ничего не нашёл)",
+                    choices=[("нет", "")]
+                    + [
+                        (gtin_decoders.BACKENDS[name].title, name)
+                        for name in gtin_decoders.available_backends()
+                    ],
+                    value="",
+                )
+            with gr.Accordion("Параметры libdmtx", open=False):
+                decoder_auto_lock_input = gr.Checkbox(
+                    label="Автофиксация по первым успешным страницам", value=True
+                )
+                decoder_param_inputs = [
+                    gr.Number(label="Таймаут, мс", value=0, minimum=0, step=10),
+                    gr.Number(label="Максимум символов (max_count)", value=0, minimum=0, step=1),
+                    gr.Number(label="Сжатие (shrink)", value=0, minimum=0, step=1),
+                    gr.Number(label="Зазор (gap_size)", value=0, minimum=0, step=1),
+                    gr.Number(label="Отклонение (deviation)", value=0, minimum=0, step=1),
+                    gr.Number(label="Порог (threshold)", value=0, minimum=0, maximum=100, step=1),
+                    gr.Number(label="Минимальная сторона, px", value=0, minimum=0, step=1),
+                    gr.Number(label="Максимальная сторона, px", value=0, minimum=0, step=1),
+                ]
+            max_zoom_input = gr.Number(
+                label="Потолок масштаба при повторных попытках",
+                value=GTINScanner.DEFAULT_MAX_ZOOM,
+                minimum=1,
+                maximum=GTINScanner.MAX_SCAN_ZOOM,
+                step=0.5,
+            )
+            export_format_input = gr.Dropdown(
+                label="Формат файла результатов",
+                choices=[
+                    (gtin_export.WRITERS[name].title, name)
+                    for name in gtin_export.available_formats()
+                ],
+                value=gtin_export.DEFAULT_FORMAT,
+            )
+            export_memory_input = gr.Number(
+                label="Память для сортировки архива по GTIN, МБ",
+                value=gtin_export.GtinZipWriter.DEFAULT_MEMORY_MB,
+                minimum=16,
+                step=16,
+            )
             scan_btn = gr.Button("⚡ Начать сканирование", variant="primary")
             stop_btn = gr.Button("⏹ Остановить", variant="stop")
             stats_display = gr.Textbox(label="Статистика", value="Готов к работе", lines=2)
             scan_status = gr.Textbox(label="Детали сканирования", value="", lines=3)
             current_page_display = gr.Textbox(label="Текущая страница", value="", lines=2)
-            csv_output = gr.File(label="Скачать CSV файл", visible=True)
+            csv_output = gr.File(label="Скачать файл результатов", visible=True)
+            partial_btn = gr.Button("📥 Скачать промежуточный результат")
 
     pdf_input.change(fn=scanner.load_pdf_preview, inputs=[pdf_input], outputs=[preview_image, load_status])
     preview_image.select(fn=scanner.handle_image_click, outputs=[selection_status])
     scan_btn.click(
         fn=scanner.scan_pdf_with_live_progress,
-        inputs=[max_pages_input],
+        inputs=[
+            max_pages_input,
+            render_profile_input,
+            adaptive_zoom_input,
+            max_zoom_input,
+            embedded_images_input,
+            vector_drawings_input,
+            page_scans_input,
+            text_layer_input,
+            text_confirm_input,
+            auto_strategy_input,
+            track_symbol_input,
+            whole_page_input,
+            preprocess_variants_input,
+            mosaic_pages_input,
+            grid_rows_input,
+            grid_cols_input,
+            grid_detect_input,
+            export_format_input,
+            export_memory_input,
+            decoder_backend_input,
+            decoder_fallback_input,
+            decoder_auto_lock_input,
+            *decoder_param_inputs,
+        ],
         outputs=[scan_status, csv_output, stats_display],
     )
+    preflight_btn.click(
+        fn=scanner.preflight_document,
+        inputs=[
+            max_pages_input,
+            render_profile_input,
+            max_zoom_input,
+            embedded_images_input,
+            vector_drawings_input,
+            page_scans_input,
+            text_layer_input,
+        ],
+        outputs=[preflight_display],
+    )
     stop_btn.click(
         fn=scanner.stop_scan,
         outputs=[scan_status, stats_display, current_page_display, csv_output],
     )
 
+    partial_btn.click(fn=scanner.download_partial, outputs=[csv_output])
+
     timer = gr.Timer(value=2)
     timer.tick(
         fn=scanner.get_live_progress,
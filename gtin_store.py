@@ -0,0 +1,216 @@
+"""
+Компактное хранилище кодов маркировки
+
+Код в виде ``str`` занимает в памяти около 140 байт (заголовок объекта,
+данные и ссылка в списке), и заметная часть этого — повторяющийся GTIN и
+разметка полей. Здесь GTIN хранится один раз в словаре, на код приходится
+его индекс (``array('I')``), номер страницы (``array('I')``) и упакованный
+остаток — серийный номер и крипто-хвост — в общем буфере со смещениями
+(``array('Q')``).
+
+Остаток канонического кода (``21`` + серийный номер + GS + хвост из
+``gtin_gs1.CRYPTO_TAILS``) хранится без AI и разделителей: байт схемы,
+серийный номер и значения хвоста; код проверки 92 (base64) — в двоичном
+виде. Остаток другой структуры хранится как есть.
+
+Строки кодов создаются только по запросу (индекс, итерация); выгрузка
+(``write``) и группировка по GTIN (``by_gtin``) работают с байтами.
+"""
+
+import base64
+import binascii
+import sys
+from array import array
+from typing import Iterator, Optional, Union
+
+from gtin_gs1 import CRYPTO_TAILS, GS
+
+_PREFIX = "01"
+_PREFIX_BYTES = b"01"
+# Старший бит индекса GTIN: остаток — весь код (GTIN не в начале кода)
+_FULL_CODE = 0x80000000
+# Код без GTIN
+_NO_GTIN = 0xFFFFFFFF
+
+# Байт схемы упакованного остатка: биты 0–1 — номер хвоста в CRYPTO_TAILS + 1
+# (0 — остаток хранится как есть), бит 2 — последнее значение хвоста в base64
+# упаковано в байты, биты 3–4 — число символов «=» в нём
+_RAW = 0
+_BASE64 = 0x04
+_GS_BYTE = GS.encode("ascii")
+
+
+def _pack(rest: str) -> bytes:
+    """Упаковывает остаток кода после GTIN (см. описание модуля)."""
+    end = rest.find(GS)
+    if rest.startswith("21") and end > 2 and rest.isascii():
+        parts = rest[end + 1 :].split(GS)
+        for layout, tail in enumerate(CRYPTO_TAILS, 1):
+            if len(parts) != len(tail) or not all(
+                part.startswith(ai) and len(part) == len(ai) + length
+                for part, (ai, length) in zip(parts, tail)
+            ):
+                continue
+            values = [part[len(ai) :] for part, (ai, _) in zip(parts, tail)]
+            last = values.pop()
+            try:
+                packed = base64.b64decode(last, validate=True)
+            except binascii.Error:
+                packed = None
+            if packed is not None and base64.b64encode(packed).decode("ascii") == last:
+                layout |= _BASE64 | (last.count("=") << 3)
+            else:
+                packed = last.encode("ascii")
+            return (
+                bytes((layout,))
+                + rest[2:end].encode("ascii")
+                + "".join(values).encode("ascii")
+                + packed
+            )
+    return bytes((_RAW,)) + rest.encode("utf-8")
+
+
+def _unpack(packed: bytes) -> bytes:
+    """Обратное к ``_pack``: остаток кода в байтах."""
+    layout = packed[0]
+    if layout == _RAW:
+        return packed[1:]
+    tail = CRYPTO_TAILS[(layout & 0x03) - 1]
+    last_len = tail[-1][1]
+    if layout & _BASE64:
+        last_len = last_len * 3 // 4 - (layout >> 3)
+    head_len = sum(length for _, length in tail[:-1])
+    serial_end = len(packed) - last_len - head_len
+    last = packed[len(packed) - last_len :]
+    if layout & _BASE64:
+        last = base64.b64encode(last)
+    fields = []
+    position = serial_end
+    for ai, length in tail[:-1]:
+        fields.append(ai.encode("ascii") + packed[position : position + length])
+        position += length
+    fields.append(tail[-1][0].encode("ascii") + last)
+    return b"21" + packed[1:serial_end] + _GS_BYTE + _GS_BYTE.join(fields)
+
+
+class CodeStore:
+    """Коды с номерами страниц в плоских массивах.
+
+    Поддерживает ``len``, индексацию, срезы (новое хранилище), итерацию по
+    строкам кодов и ``iter_bytes`` — по байтам без создания строк.
+    """
+
+    def __init__(self) -> None:
+        self._gtins: list[str] = []
+        # «01» + GTIN в байтах, чтобы не кодировать префикс для каждого кода
+        self._prefixes: list[bytes] = []
+        self._gtin_ids: dict[str, int] = {}
+        self._gtin_index = array("I")
+        self.pages = array("I")
+        self._data = bytearray()
+        self._offsets = array("Q", [0])
+
+    def _gtin_id(self, gtin: str) -> int:
+        gtin_id = self._gtin_ids.get(gtin)
+        if gtin_id is None:
+            gtin_id = self._gtin_ids[gtin] = len(self._gtins)
+            self._gtins.append(gtin)
+            self._prefixes.append(_PREFIX_BYTES + gtin.encode("ascii"))
+        return gtin_id
+
+    def append(self, code: str, page: int = 0, gtin: Optional[str] = None) -> None:
+        """Добавляет код; ``gtin`` нужен, только если код начинается не с AI 01."""
+        prefixed = (
+            code[2:16]
+            if code.startswith(_PREFIX) and len(code) >= 16 and code[2:16].isdigit()
+            else None
+        )
+        gtin = gtin or prefixed
+        if gtin is None:
+            key, rest = _NO_GTIN, code
+        elif gtin == prefixed:
+            key, rest = self._gtin_id(gtin), code[16:]
+        else:
+            key, rest = self._gtin_id(gtin) | _FULL_CODE, code
+        self._gtin_index.append(key)
+        self.pages.append(page)
+        self._data += rest.encode("utf-8") if key & _FULL_CODE else _pack(rest)
+        self._offsets.append(len(self._data))
+
+    def extend(self, codes, page: int = 0) -> None:
+        for code in codes:
+            self.append(code, page)
+
+    def __len__(self) -> int:
+        return len(self._gtin_index)
+
+    @property
+    def nbytes(self) -> int:
+        """Примерный объём памяти: массивы и буфер остатков с запасом роста, словарь GTIN."""
+        buffers = (self._gtin_index, self.pages, self._offsets, self._data)
+        return sum(map(sys.getsizeof, buffers)) + len(self._gtins) * 128
+
+    def gtin(self, index: int) -> Optional[str]:
+        key = self._gtin_index[index]
+        return None if key == _NO_GTIN else self._gtins[key & ~_FULL_CODE]
+
+    def code_bytes(self, index: int) -> bytes:
+        stored = bytes(self._data[self._offsets[index] : self._offsets[index + 1]])
+        key = self._gtin_index[index]
+        if key & _FULL_CODE:
+            return stored
+        return self._prefixes[key] + _unpack(stored)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return self._slice(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("индекс кода вне хранилища")
+        return self.code_bytes(index).decode("utf-8")
+
+    def _slice(self, index: slice) -> "CodeStore":
+        start, stop, step = index.indices(len(self))
+        store = CodeStore()
+        store._gtins = list(self._gtins)
+        store._prefixes = list(self._prefixes)
+        store._gtin_ids = dict(self._gtin_ids)
+        if step == 1:
+            stop = max(start, stop)
+            base = self._offsets[start]
+            store._gtin_index = self._gtin_index[start:stop]
+            store.pages = self.pages[start:stop]
+            store._data = self._data[base : self._offsets[stop]]
+            store._offsets = array("Q", (offset - base for offset in self._offsets[start : stop + 1]))
+            return store
+        for position in range(start, stop, step):
+            store._gtin_index.append(self._gtin_index[position])
+            store.pages.append(self.pages[position])
+            store._data += self._data[self._offsets[position] : self._offsets[position + 1]]
+            store._offsets.append(len(store._data))
+        return store
+
+    def __iter__(self) -> Iterator[str]:
+        for code in self.iter_bytes():
+            yield code.decode("utf-8")
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        for index in range(len(self)):
+            yield self.code_bytes(index)
+
+    def by_gtin(self) -> dict:
+        """``{GTIN: array('I') индексов кодов}``; коды без GTIN — под ключом ``None``."""
+        groups: dict = {}
+        for position, key in enumerate(self._gtin_index):
+            gtin = None if key == _NO_GTIN else self._gtins[key & ~_FULL_CODE]
+            indices = groups.get(gtin)
+            if indices is None:
+                indices = groups[gtin] = array("I")
+            indices.append(position)
+        return groups
+
+    def write(self, file, separator: bytes = b"\n") -> int:
+        """Пишет коды в двоичный файл по одному на строку; возвращает число кодов."""
+        file.writelines(code + separator for code in self.iter_bytes())
+        return len(self)
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория, а не в пакете
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class BoxBackend:
+    """Тестовый бэкенд декодирования: «символ» — залитый тёмный прямоугольник.
+
+    Прямоугольники разделены светлыми строками и столбцами; данные — номер
+    прямоугольника в порядке чтения, ``rect`` — в соглашении pylibdmtx
+    (``top`` отсчитывается от нижнего края изображения).
+    """
+
+    name = "boxes"
+    title = "тестовые прямоугольники"
+    options = None
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def decode(self, image, max_count=None, **kwargs) -> list:
+        import numpy as np
+        from pylibdmtx.pylibdmtx import Decoded, Rect
+
+        gray = image if isinstance(image, np.ndarray) else np.asarray(image.convert("L"))
+        dark = gray < 128
+        if dark.all():  # например, инвертированная пустая ячейка
+            return []
+        height = dark.shape[0]
+        decoded = []
+        for y0, y1 in _runs(dark.any(axis=1)):
+            for x0, x1 in _runs(dark[y0:y1].any(axis=0)):
+                rows = np.flatnonzero(dark[y0:y1, x0:x1].any(axis=1))
+                top, bottom = y0 + rows[0], y0 + rows[-1] + 1
+                rect = Rect(int(x0), int(height - bottom), int(x1 - x0), int(bottom - top))
+                decoded.append(Decoded(str(len(decoded)).encode(), rect))
+        return decoded[:max_count] if max_count else decoded
+
+
+def _runs(mask):
+    """Отрезки ``[начало, конец)`` подряд идущих ``True``."""
+    runs = []
+    start = None
+    for index, value in enumerate(mask):
+        if value and start is None:
+            start = index
+        elif not value and start is not None:
+            runs.append((start, index))
+            start = None
+    if start is not None:
+        runs.append((start, len(mask)))
+    return runs
+
+
+@pytest.fixture
+def scanner(monkeypatch, tmp_path):
+    """Сканер с тестовым бэкендом ``boxes`` вместо libdmtx."""
+    pytest.importorskip("fitz")
+    pytest.importorskip("gradio")
+    # Без библиотеки libdmtx pylibdmtx не импортируется (ImportError, не ModuleNotFoundError)
+    pytest.importorskip("pylibdmtx.pylibdmtx", exc_type=ImportError)
+    monkeypatch.chdir(tmp_path)  # журнал приложения пишется в текущий каталог
+    import gtin_decoders
+    import gtin_scanner_live
+
+    monkeypatch.setitem(gtin_decoders.BACKENDS, BoxBackend.name, BoxBackend)
+    instance = gtin_scanner_live.GTINScanner()
+    instance.decoder_chain = gtin_decoders.DecoderChain(BoxBackend.name)
+    return instance
@@ -0,0 +1,54 @@
+"""Автофиксация параметров libdmtx (DecoderLock) и лимиты мозаики."""
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+def locked(gtin_scanner_live, area):
+    lock = gtin_scanner_live.DecoderLock(2)
+    lock.observe(None, 20.0, 1, 0.05, area)
+    lock.observe(None, 22.0, 1, 0.04, area * 2)
+    return lock
+
+
+def capture_options(scanner):
+    calls = []
+    decode = scanner.decoder_chain.decode
+
+    def recording(image, **kwargs):
+        calls.append(kwargs)
+        return decode(image, **kwargs)
+
+    scanner.decoder_chain.decode = recording
+    return calls
+
+
+def test_timeout_scales_with_area(scanner):
+    import gtin_scanner_live
+
+    lock = locked(gtin_scanner_live, 10_000)
+    assert lock.params["timeout"] == 200
+    assert lock.decode_kwargs(2.0, 10_000)["timeout"] == 200
+    assert lock.decode_kwargs(2.0, 40_000)["timeout"] == 800
+    assert lock.decode_kwargs(2.0, 5_000)["timeout"] == 200
+
+
+def test_locked_mosaic_timeout_scaled_once(scanner):
+    import gtin_scanner_live
+
+    scanner.decoder_lock = locked(gtin_scanner_live, 100 * 100)
+    calls = capture_options(scanner)
+    mosaic = np.full((330, 660), 255, dtype=np.uint8)  # 8 областей 100x100 с промежутками
+    scanner._decode_image(mosaic, 0, 2.0, tiles=8)
+    assert calls[-1]["timeout"] == math.ceil(200 * mosaic.size / 10_000)
+    assert calls[-1]["max_count"] == 8
+
+
+def test_manual_mosaic_timeout_multiplied_by_tiles(scanner):
+    scanner.decode_options = {"timeout": 100}
+    calls = capture_options(scanner)
+    scanner._decode_image(np.full((330, 660), 255, dtype=np.uint8), 0, 2.0, tiles=8)
+    assert calls[-1]["timeout"] == 800
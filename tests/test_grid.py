@@ -0,0 +1,54 @@
+"""Декодирование сетки этикеток: порядок чтения и пустые ячейки (_decode_grid)."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+GRID = (2, 3)
+CELL = 100
+EMPTY = (1, 1)
+
+
+def make_page():
+    document = fitz.open()
+    page = document.new_page(width=GRID[1] * CELL, height=GRID[0] * CELL)
+    for row in range(GRID[0]):
+        for col in range(GRID[1]):
+            if (row, col) != EMPTY:
+                page.draw_rect(cell_symbol(row, col), color=None, fill=(0, 0, 0))
+    return document
+
+
+def cell_symbol(row, col):
+    # Символ смещён в ячейке по-разному, чтобы перепутанные ячейки не совпали
+    x0, y0 = col * CELL + 20 + 10 * row, row * CELL + 30 + 5 * col
+    return fitz.Rect(x0, y0, x0 + 40, y0 + 40)
+
+
+def test_grid_reading_order_and_missing_cell(scanner):
+    document = make_page()
+    page = document[0]
+    scanner.pdf_document = document
+    scanner.roi_fractions = (0.0, 0.0, 1.0, 1.0)
+    clip = scanner._page_clip(page)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        cells, rung = scanner._decode_grid(
+            page, clip, GRID, "barcode", scanner.DEFAULT_MAX_ZOOM, 4, pool
+        )
+
+    assert [(row, col) for row, col, _ in cells] == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+    assert rung.startswith("grid/")
+    for row, col, symbol in cells:
+        if (row, col) == EMPTY:
+            assert symbol is None
+            continue
+        for actual, expected in zip(symbol.bbox, cell_symbol(row, col)):
+            assert actual == pytest.approx(expected, abs=1.0)
+
+    missing = [(4, row, col) for row, col, symbol in cells if symbol is None]
+    assert scanner._format_missing_cells(len(missing), missing) == "пустых ячеек 1: стр. 5 (2:2)"
+    assert scanner._format_missing_cells(3, missing) == "пустых ячеек 3: стр. 5 (2:2) и ещё 2"
+    assert scanner._format_missing_cells(0, []) == "все ячейки распознаны"
@@ -0,0 +1,81 @@
+"""Потоковая запись результатов (gtin_export): архив по GTIN и промежуточные копии."""
+
+import base64
+import gzip
+import os
+import random
+import tracemalloc
+import zipfile
+
+import gtin_export
+from gtin_gs1 import GS
+
+GTINS = ("04601234567893", "04607654321096")
+
+
+def make_code(rnd: random.Random, gtin: str) -> str:
+    serial = "".join(rnd.choices("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789", k=13))
+    check = base64.b64encode(rnd.randbytes(33)).decode("ascii")
+    return f"01{gtin}21{serial}{GS}91EE06{GS}92{check}"
+
+
+def write_pages(writer, pages):
+    for page_num, codes in enumerate(pages):
+        writer.write_page(
+            page_num, [(page_num + 1, code, 0, 0, 1, 1, 1.0, "test") for code in codes]
+        )
+
+
+def test_archive_sorted_and_deduplicated(tmp_path):
+    rnd = random.Random(1)
+    codes = [make_code(rnd, GTINS[index % 2]) for index in range(3000)]
+    pages = [codes[start : start + 50] for start in range(0, len(codes), 50)]
+    pages.append(codes[:100])  # повторы
+    writer = gtin_export.create_writer("gtin.zip", gtin_export.COLUMNS, memory_limit_mb=0.05)
+    write_pages(writer, pages)
+    path = writer.close()
+
+    assert writer._run_count > 1
+    assert "повторов отброшено 100" in writer.note
+    with zipfile.ZipFile(path) as archive:
+        assert sorted(archive.namelist()) == sorted(f"{gtin}.csv" for gtin in GTINS)
+        for gtin in GTINS:
+            # splitlines разбил бы коды по GS
+            lines = archive.read(f"{gtin}.csv").decode("utf-8").split("\n")[:-1]
+            expected = sorted({code for code in codes if code[2:16] == gtin})
+            assert lines == expected
+
+
+def test_spill_peak_memory_stays_under_limit():
+    limit_mb = 2
+    rnd = random.Random(2)
+    pages = [[make_code(rnd, GTINS[0]) for _ in range(100)] for _ in range(400)]
+    tracemalloc.start()
+    try:
+        writer = gtin_export.create_writer(
+            "gtin.zip", gtin_export.COLUMNS, memory_limit_mb=limit_mb
+        )
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        write_pages(writer, pages)
+        writer.close()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    assert writer._run_count > 1
+    assert peak < limit_mb * (1 << 20)
+
+
+def test_snapshot_replaces_previous_copy():
+    writer = gtin_export.GzipCsvWriter(gtin_export.COLUMNS)
+    rnd = random.Random(3)
+    write_pages(writer, [[make_code(rnd, GTINS[0])]])
+    first = writer.snapshot()
+    writer.write_page(1, [(2, make_code(rnd, GTINS[1]), 0, 0, 1, 1, 1.0, "test")])
+    second = writer.snapshot()
+    assert not os.path.exists(first)
+    with gzip.open(second, "rt", encoding="utf-8") as partial:
+        assert len(partial.read().split("\n")) == 4  # заголовок, две строки, пустой хвост
+    path = writer.close()
+    assert not os.path.exists(second)
+    os.remove(path)
@@ -0,0 +1,28 @@
+"""Коды маркировки в текстовом слое (gtin_extract)."""
+
+import pytest
+
+pytest.importorskip("fitz")
+
+import gtin_extract
+import gtin_gs1
+from gtin_gs1 import GS
+
+GTIN = "04601234567893"
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (f"01{GTIN}21ABC91EE0692" + "Q" * 44, f"01{GTIN}21ABC{GS}91EE06{GS}92" + "Q" * 44),
+        (f"01{GTIN}21ABC91EE0692" + "Q" * 88, f"01{GTIN}21ABC{GS}91EE06{GS}92" + "Q" * 88),
+        (f"01{GTIN}21ABC93abcd", f"01{GTIN}21ABC{GS}93abcd"),
+    ],
+)
+def test_text_code_for_every_crypto_tail(text, expected):
+    assert gtin_extract._match_text_code(text) == expected
+    assert gtin_gs1.normalize(expected) == expected
+
+
+def test_patterns_follow_crypto_tails():
+    assert len(gtin_extract.TEXT_CODE_PATTERNS) == len(gtin_gs1.CRYPTO_TAILS)
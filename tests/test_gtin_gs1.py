@@ -0,0 +1,87 @@
+"""Разбор и нормализация кодов маркировки (gtin_gs1)."""
+
+import pytest
+
+import gtin_gs1
+from gtin_gs1 import GS
+
+
+def with_check_digit(body: str) -> str:
+    """Дописывает к 13 цифрам контрольную цифру GTIN."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return body + str((10 - total % 10) % 10)
+
+
+GTIN = with_check_digit("0460123456789")
+CHECK_44 = "X+zrZv/IbzjZUnhsbWlsecLbwjndTpG0ZynXOiAbCdE="
+CHECK_88 = "Q" * 86 + "=="
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        f"01{GTIN}21ABC0000{GS}91EE06{GS}92{CHECK_44}",
+        f"01{GTIN}21ABC0000{GS}91EE06{GS}92{CHECK_88}",
+        f"01{GTIN}215'ABC{GS}93dGVz",
+        f"01{GTIN}21SSSSSSSSSSSSSSS{GS}800512345693XXXX",
+        f"01{GTIN}21SSSSSSS{GS}17251231310300050091EE06{GS}92{CHECK_44}",
+    ],
+)
+def test_separated_and_unseparated_forms_normalize_alike(code):
+    assert gtin_gs1.normalize(code) == code
+    assert gtin_gs1.normalize(code.replace(GS, "")) == code
+
+
+def test_fixed_length_field_is_split_from_too_long_serial():
+    fields = gtin_gs1.parse(f"01{GTIN}21SSSSSSSSSSSSSSS800512345693XXXX")
+    assert fields == [
+        ("01", GTIN),
+        ("21", "SSSSSSSSSSSSSSS"),
+        ("8005", "123456"),
+        ("93", "XXXX"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        f"01{GTIN}21ABC17251231{GS}91ABCD{GS}92{CHECK_44}",
+        f"01{GTIN}211234567817251231{GS}91ABCD{GS}92{CHECK_44}",
+        f"01{GTIN}21SSSSSSS8005123456{GS}93XXXX",
+    ],
+)
+def test_serial_ending_in_fixed_field_stays_whole(code):
+    fields = gtin_gs1.parse(code)
+    assert gtin_gs1.parse(code.replace(GS, "")) == fields
+    assert gtin_gs1.normalize(code.replace(GS, "")) == code
+
+
+def test_93_inside_gtin_and_serial():
+    gtin = with_check_digit("0469300000000")
+    assert "93" in gtin
+    code = f"01{gtin}21A93B93{GS}93abcd"
+    assert gtin_gs1.parse(code) == [("01", gtin), ("21", "A93B93"), ("93", "abcd")]
+    assert gtin_gs1.normalize(code.replace(GS, "")) == code
+
+
+@pytest.mark.parametrize("prefix", ["]d2", "\xe8", GS])
+def test_symbology_and_fnc1_prefix(prefix):
+    code = f"01{GTIN}21ABC0000{GS}93dGVz"
+    assert gtin_gs1.normalize(prefix + code) == code
+
+
+def test_bytes_with_fnc1_separators():
+    code = f"01{GTIN}21ABC0000{GS}93dGVz"
+    raw = code.replace(GS, "\xe8").encode("latin-1")
+    assert gtin_gs1.normalize(raw) == code
+
+
+def test_bad_check_digit():
+    bad = GTIN[:-1] + str((int(GTIN[-1]) + 1) % 10)
+    assert not gtin_gs1.valid_gtin(bad)
+    assert gtin_gs1.normalize(f"01{bad}21ABC0000{GS}93dGVz") is None
+
+
+def test_unknown_tail_is_rejected():
+    assert gtin_gs1.normalize(f"01{GTIN}21ABC0000{GS}91EE06") is None
+    assert gtin_gs1.normalize("not a code") is None
@@ -0,0 +1,57 @@
+"""Прямая привязка к libdmtx: переиспользуемое состояние декодера (gtin_libdmtx)."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Нужна сама библиотека libdmtx: без неё pylibdmtx не импортируется
+pylibdmtx = pytest.importorskip("pylibdmtx.pylibdmtx", exc_type=ImportError)
+
+import gtin_libdmtx  # noqa: E402
+
+if not gtin_libdmtx.available():
+    pytest.skip("привязка libdmtx недоступна", allow_module_level=True)
+
+SIZE = (400, 200)
+
+
+def symbol(data: bytes) -> Image.Image:
+    encoded = pylibdmtx.encode(data)
+    return Image.frombytes("RGB", (encoded.width, encoded.height), encoded.pixels).convert("L")
+
+
+def canvas(*placements) -> np.ndarray:
+    image = Image.new("L", SIZE, 255)
+    for data, position in placements:
+        image.paste(symbol(data), position)
+    return np.ascontiguousarray(np.asarray(image))
+
+
+def found(decoded) -> list:
+    return sorted((obj.data, tuple(obj.rect)) for obj in decoded)
+
+
+# Области одного размера: все вызовы идут через одно состояние
+IMAGES = [
+    canvas((b"LABEL-A", (10, 10)), (b"LABEL-B", (220, 60))),
+    canvas(),
+    canvas((b"LABEL-C", (150, 40))),
+    canvas((b"LABEL-A", (10, 10)), (b"LABEL-B", (220, 60))),
+]
+
+
+def test_reused_state_matches_fresh_decoder():
+    reused = gtin_libdmtx.NativeDecoder()
+    for pixels in IMAGES:
+        expected = gtin_libdmtx.NativeDecoder().decode(pixels, *SIZE)
+        assert found(reused.decode(pixels, *SIZE)) == found(expected)
+        reference = pylibdmtx.decode((pixels.tobytes(), *SIZE))
+        assert sorted(obj.data for obj in expected) == sorted(obj.data for obj in reference)
+    assert found(reused.decode(IMAGES[0], *SIZE)) and not reused.decode(IMAGES[1], *SIZE)
+
+
+def test_max_count_is_unlimited_by_default():
+    decoder = gtin_libdmtx.NativeDecoder()
+    # Прерванный перебор областей не должен влиять на следующий вызов
+    assert len(decoder.decode(IMAGES[0], *SIZE, max_count=1)) == 1
+    assert sorted(obj.data for obj in decoder.decode(IMAGES[0], *SIZE)) == [b"LABEL-A", b"LABEL-B"]
@@ -0,0 +1,47 @@
+"""Поиск кандидатов Data Matrix на странице (gtin_locator)."""
+
+import numpy as np
+
+import gtin_locator
+
+
+def test_components_four_connected():
+    mask = np.array(
+        [
+            [1, 1, 0, 0, 1],
+            [0, 1, 0, 1, 1],
+            [1, 0, 0, 0, 0],
+            [1, 1, 1, 0, 1],
+        ],
+        dtype=bool,
+    )
+    assert sorted(gtin_locator._components(mask)) == [
+        (0, 0, 1, 1),
+        (0, 3, 1, 4),
+        (2, 0, 3, 2),
+        (3, 4, 3, 4),
+    ]
+
+
+def test_components_snake_is_one_region():
+    mask = np.zeros((41, 30), dtype=bool)
+    mask[::2, :] = True
+    mask[1::4, -1] = True
+    mask[3::4, 0] = True
+    assert gtin_locator._components(mask) == [(0, 0, 40, 29)]
+
+
+def test_components_empty():
+    assert gtin_locator._components(np.zeros((5, 5), dtype=bool)) == []
+
+
+def test_locate_checkerboard_symbol():
+    page = np.full((200, 300), 255, dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    modules = rng.random((32, 32)) < 0.5
+    modules[:, 0] = modules[-1, :] = True  # L-шаблон
+    page[60:124, 100:164] = np.where(np.kron(modules, np.ones((2, 2), bool)), 0, 255)
+    boxes = gtin_locator.locate_symbols(page)
+    assert boxes
+    x0, y0, x1, y1 = boxes[0]
+    assert abs(x0 - 100) <= 4 and abs(y0 - 60) <= 4 and abs(x1 - 164) <= 4 and abs(y1 - 124) <= 4
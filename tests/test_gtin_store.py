@@ -0,0 +1,79 @@
+"""Упаковка кодов и компактное хранилище (gtin_store)."""
+
+import io
+
+import pytest
+
+import gtin_store
+from gtin_gs1 import GS
+
+GTIN = "04601234567893"
+
+
+@pytest.mark.parametrize(
+    "rest",
+    [
+        f"21ABC0000{GS}91EE06{GS}92X+zrZv/IbzjZUnhsbWlsecLbwjndTpG0ZynXOiAbCdE=",
+        f"21ABC0000{GS}91EE06{GS}92X+zrZv/IbzjZUnhsbWlsecLbwjndTpG0ZynXOiAbC==",
+        f"21ABC0000{GS}91EE06{GS}92X+zrZv/IbzjZUnhsbWlsecLbwjndTpG0ZynXOiAbCdEf",
+        f"21ABC0000{GS}91EE06{GS}92" + "Q" * 86 + "==",
+        f"21ABC0000{GS}91EE06{GS}92" + "!" * 44,
+        f"21ABC0000{GS}91EE06{GS}92" + "A" * 43 + "B",
+        f"215'ABC{GS}93dGVz",
+        f"215'ABC{GS}93d!Vz",
+        f"21SSSSSSS{GS}800512345693XXXX",
+        "21",
+        "",
+        "мусор",
+    ],
+)
+def test_pack_round_trip(rest):
+    packed = gtin_store._pack(rest)
+    assert gtin_store._unpack(packed) == rest.encode("utf-8")
+
+
+def test_base64_92_is_packed_to_binary():
+    rest = f"21ABC0000{GS}91EE06{GS}92X+zrZv/IbzjZUnhsbWlsecLbwjndTpG0ZynXOiAbCdE="
+    packed = gtin_store._pack(rest)
+    assert packed[0] & gtin_store._BASE64
+    # байт схемы + серийный номер + значение 91 + 32 байта вместо 44 символов
+    assert len(packed) == 1 + 7 + 4 + 32
+
+
+def test_code_store_round_trip():
+    codes = [
+        f"01{GTIN}21ABC0000{GS}93dGVz",
+        f"01{GTIN}21ABC0001{GS}91EE06{GS}92" + "Q" * 86 + "==",
+        f"0104607654321096215'ABC{GS}93dGVz",
+        f"21XYZ{GS}01{GTIN}{GS}93dGVz",
+        "no gtin",
+    ]
+    store = gtin_store.CodeStore()
+    for page, code in enumerate(codes[:3]):
+        store.append(code, page)
+    store.append(codes[3], 3, gtin=GTIN)
+    store.append(codes[4], 4)
+
+    assert len(store) == len(codes)
+    assert list(store) == codes
+    assert store[-1] == codes[-1]
+    assert list(store[1:4]) == codes[1:4]
+    assert list(store[::2]) == codes[::2]
+    assert list(store.pages) == [0, 1, 2, 3, 4]
+    assert [store.gtin(index) for index in range(len(store))] == [
+        GTIN,
+        GTIN,
+        "04607654321096",
+        GTIN,
+        None,
+    ]
+    assert {gtin: list(indices) for gtin, indices in store.by_gtin().items()} == {
+        GTIN: [0, 1, 3],
+        "04607654321096": [2],
+        None: [4],
+    }
+    target = io.BytesIO()
+    assert store.write(target) == len(codes)
+    assert target.getvalue().decode("utf-8") == "".join(code + "\n" for code in codes)
+    with pytest.raises(IndexError):
+        store[len(codes)]
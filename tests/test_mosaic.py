@@ -0,0 +1,39 @@
+"""Мозаика страниц: символы тайлов возвращаются своим страницам (_decode_mosaic)."""
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+ROI_FRACTIONS = (0.0, 0.0, 0.5, 1.0)
+# Символы в неповёрнутых координатах страниц 300x200; у третьей символа нет
+SYMBOLS = [fitz.Rect(20, 30, 50, 60), fitz.Rect(90, 120, 140, 170), None, fitz.Rect(60, 20, 80, 40)]
+ROTATIONS = [0, 90, 0, 270]
+
+
+def make_document():
+    document = fitz.open()
+    for symbol, rotation in zip(SYMBOLS, ROTATIONS):
+        page = document.new_page(width=300, height=200)
+        if symbol is not None:
+            page.draw_rect(symbol, color=None, fill=(0, 0, 0))
+        page.set_rotation(rotation)
+    return document
+
+
+def test_mosaic_maps_symbols_back_to_pages(scanner):
+    document = make_document()
+    scanner.pdf_document = document
+    scanner.roi_fractions = ROI_FRACTIONS
+    batch = [(num, document[num], scanner._page_clip(document[num])) for num in range(len(document))]
+    zoom = 2.0
+
+    results = scanner._decode_mosaic(batch, zoom, "barcode")
+
+    assert sorted(results) == [0, 1, 3]
+    for num, (decoded_objects, size) in results.items():
+        page, clip = document[num], batch[num][2]
+        assert size == (round(clip.width * zoom), round(clip.height * zoom))
+        placed = scanner._place(page, clip, zoom, size, decoded_objects)
+        assert len(placed) == 1
+        for actual, expected in zip(placed[0].bbox, SYMBOLS[num]):
+            assert actual == pytest.approx(expected, abs=1.0)
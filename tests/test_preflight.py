@@ -0,0 +1,40 @@
+"""Предварительный анализ документа (GTINScanner._run_preflight)."""
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+CODE = "010460123456789321ABC93abcd"
+
+
+def make_document(pages, box=False):
+    document = fitz.open()
+    for _ in range(pages):
+        page = document.new_page(width=300, height=200)
+        # Код только в текстовом слое: белый текст на рендеринге не виден
+        page.insert_text((20, 40), CODE, fontsize=6, color=(1, 1, 1))
+        if box:
+            page.draw_rect(fitz.Rect(150, 100, 180, 130), color=None, fill=(0, 0, 0))
+    return document
+
+
+def test_strategy_not_verified_without_render_reference(scanner):
+    scanner.pdf_document = make_document(3)
+    scanner.roi_fractions = (0, 0, 1, 1)
+    preflight = scanner._run_preflight(3, "barcode", 3.0, frozenset({"text"}))
+    assert preflight["kinds"]["text"] == 3
+    assert preflight["results"]["text"]["codes"][0] == ["010460123456789321ABC\x1d93abcd"]
+    assert preflight["strategy"] == "render"
+
+
+def test_preflight_leaves_scan_state_untouched(scanner):
+    import gtin_scanner_live
+
+    scanner.pdf_document = make_document(3, box=True)
+    scanner.roi_fractions = (0, 0, 1, 1)
+    lock = scanner.decoder_lock = gtin_scanner_live.DecoderLock(2)
+    chain = scanner.preprocess_chain
+    wins = dict(chain.wins)
+    scanner._run_preflight(3, "barcode", 3.0, frozenset())
+    assert scanner.decoder_lock is lock and lock.observations == [] and lock.params is None
+    assert scanner.preprocess_chain is chain and dict(chain.wins) == wins
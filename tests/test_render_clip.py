@@ -0,0 +1,47 @@
+"""Рендеринг выделенной области на повёрнутых страницах (_page_clip, _render_clip)."""
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+# Символ в неповёрнутых координатах страницы 300x200
+SYMBOL = fitz.Rect(40, 120, 70, 150)
+ROI_FRACTIONS = (0.1, 0.5, 0.3, 0.9)
+
+
+def make_page(rotation):
+    document = fitz.open()
+    page = document.new_page(width=300, height=200)
+    page.draw_rect(SYMBOL, color=None, fill=(0, 0, 0))
+    page.set_rotation(rotation)
+    return document
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_clip_covers_roi_on_rotated_page(scanner, rotation):
+    document = make_page(rotation)
+    page = document[0]
+    scanner.pdf_document = document
+    scanner.roi_fractions = ROI_FRACTIONS
+
+    roi = scanner._page_roi(page)
+    assert roi == fitz.Rect(30, 100, 90, 180)
+    clip = scanner._page_clip(page)
+    assert clip * page.derotation_matrix == roi
+
+    zoom = 2.0
+    image = scanner._render_clip(page, clip, zoom, "barcode")
+    assert image.size == (round(clip.width * zoom), round(clip.height * zoom))
+    decoded = scanner._decode_image(image, 0, zoom)
+    placed = scanner._place(page, clip, zoom, image.size, decoded)
+    assert len(placed) == 1
+    bbox = placed[0].bbox
+    for actual, expected in zip(bbox, SYMBOL):
+        assert actual == pytest.approx(expected, abs=1.0)
+
+
+def test_roi_outside_page_has_no_clip(scanner):
+    document = make_page(90)
+    scanner.pdf_document = document
+    scanner.roi_fractions = (1.2, 1.2, 1.5, 1.5)
+    assert scanner._page_clip(document[0]) is None
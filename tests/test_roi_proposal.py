@@ -0,0 +1,58 @@
+"""Предложение области сканирования при загрузке (GTINScanner._propose_roi)."""
+
+import types
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+
+def save_document(path, pages=2):
+    document = fitz.open()
+    for _ in range(pages):
+        page = document.new_page(width=300, height=200)
+        page.draw_rect(fitz.Rect(40, 100, 70, 130), color=None, fill=(0, 0, 0))
+    document.save(path)
+    return types.SimpleNamespace(name=str(path))
+
+
+def locate_box(page, profile):
+    # Закрашенный прямоугольник не похож на текстуру Data Matrix — кандидат задаём явно
+    return [fitz.Rect(40, 100, 70, 130)]
+
+
+def test_proposal_decodes_within_budget(scanner, tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, "_locate_candidates", locate_box)
+    calls = []
+    decode = scanner.decoder_chain.decode
+
+    def recording(image, **kwargs):
+        calls.append(kwargs)
+        return decode(image, **kwargs)
+
+    scanner.decoder_chain.decode = recording
+    chain, engine = scanner.preprocess_chain, scanner.preprocess_engine
+    scanner.load_pdf_preview(save_document(tmp_path / "labels.pdf"))
+
+    assert scanner.roi_fractions is not None
+    assert calls
+    budget_ms = scanner.ROI_PROPOSAL_SECONDS * 1000
+    assert all(0 < call["timeout"] <= budget_ms for call in calls)
+    # Пробы идут с отдельной цепочкой и буферами; параметры сканирования не меняются
+    assert scanner.decode_options == {}
+    assert scanner.preprocess_engine is engine
+    assert not scanner.preprocess_chain.wins and chain.variants == scanner.preprocess_chain.variants
+
+
+def test_proposal_gives_up_after_budget(scanner, tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, "_locate_candidates", locate_box)
+    monkeypatch.setattr(scanner, "ROI_PROPOSAL_SECONDS", 0)
+    scanner.load_pdf_preview(save_document(tmp_path / "labels.pdf"))
+    assert scanner.roi_fractions is None
+
+
+def test_upload_refused_while_scanning(scanner, tmp_path):
+    scanner.scanning = True
+    _, message = scanner.load_pdf_preview(save_document(tmp_path / "labels.pdf"))
+    assert "Сканирование уже выполняется" in message
+    assert scanner.pdf_document is None
@@ -0,0 +1,56 @@
+"""Отслеживание положения символа между страницами (SymbolTracker)."""
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+FIRST = fitz.Rect(40, 40, 70, 70)
+MOVED = fitz.Rect(200, 120, 230, 150)
+
+
+def make_document(positions, rotation=0):
+    document = fitz.open()
+    for rect in positions:
+        page = document.new_page(width=300, height=200)
+        page.draw_rect(rect, color=None, fill=(0, 0, 0))
+        page.set_rotation(rotation)
+    return document
+
+
+@pytest.mark.parametrize("rotation", [0, 90])
+def test_tracker_reseeks_after_miss(scanner, rotation):
+    import gtin_scanner_live
+
+    document = make_document([FIRST, FIRST, MOVED, MOVED], rotation)
+    scanner.pdf_document = document
+    scanner.roi_fractions = (0, 0, 1, 1)
+    tracker = gtin_scanner_live.SymbolTracker()
+
+    rungs = []
+    for page_num, expected in enumerate([FIRST, FIRST, MOVED, MOVED]):
+        page = document[page_num]
+        placed, rung = scanner._decode_with_ladder(
+            page, scanner._page_clip(page), "barcode", 3.0, page_num, tracker=tracker
+        )
+        assert len(placed) == 1
+        for actual, value in zip(placed[0].bbox, expected):
+            assert actual == pytest.approx(value, abs=1.0)
+        rungs.append(rung)
+
+    # Первая страница — без окна, вторая — в окне, третья — промах окна и
+    # поиск во всей области, четвёртая — снова в окне вокруг нового положения
+    assert [rung.endswith("/track") for rung in rungs] == [False, True, False, True]
+
+
+def test_window_follows_update(scanner):
+    import gtin_scanner_live
+
+    document = make_document([FIRST])
+    page = document[0]
+    roi = page.rect
+    tracker = gtin_scanner_live.SymbolTracker(margin=0.5)
+    assert tracker.window(page, roi) is None
+    tracker.update(page, FIRST)
+    assert tracker.window(page, roi) == fitz.Rect(25, 25, 85, 85)
+    tracker.update(page, MOVED)
+    assert tracker.window(page, roi) == fitz.Rect(185, 105, 245, 165)